@@ -4,6 +4,7 @@ import nbformat as nbf
 import inspect
 from textwrap import dedent
 from cse6040_devkit.test_case.sample_gen import SampleGenerator
+from cse6040_devkit.test_case.case_file import FORMAT_VERSION as CASE_FILE_FORMAT_VERSION
 from jinja2 import Environment, PackageLoader
 import cse6040_devkit.plugins 
 import cse6040_devkit.utils
@@ -11,36 +12,155 @@ import dill
 from copy import deepcopy
 from cryptography.fernet import Fernet
 from random import randint
+import zlib
+import json
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _devkit_version():
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        return version('cse6040_devkit')
+    except PackageNotFoundError:
+        return 'unknown'
+
+def _file_stamp(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+_worker_builder = None
+
+def _init_artifact_worker(builder):
+    global _worker_builder
+    _worker_builder = builder
+
+def _write_exercise_artifacts_in_worker(ex_name, write_cases):
+    _worker_builder._write_exercise_artifacts(ex_name, write_cases)
+    return ex_name
+
+_worker_tester = None
+
+def _init_test_worker(tester):
+    global _worker_tester
+    _worker_tester = tester
+
+def _run_test_iterations(start, stop):
+    # Runs in a forked worker. Stops at the first failure, which is the last record returned.
+    tester = _worker_tester
+    tester.case_position = start
+    records = []
+    for i in range(start, stop):
+        try:
+            tester.run_test()
+            passed = True
+        except Exception:
+            passed = False
+        records.append((i, tester.case_index, passed, tester.last_phase_times))
+        if not passed:
+            break
+    return records
+
+def _run_iterations_in_pool(executor, n_iter, n_workers):
+    """Runs iterations 0 to `n_iter` of a test in `executor` in chunks.
+
+    Returns the records of every iteration before the first failure, in order, and the first failing iteration (None if every iteration passed). Chunks after a known failure are cancelled if they haven't started.
+    """
+    from concurrent.futures import as_completed
+    # Several chunks per worker so that a failure early on stops most of the work
+    chunk_size = max(1, -(-n_iter // (4 * n_workers)))
+    first_failure = None
+    chunks = dict()
+    with executor:
+        futures = {executor.submit(_run_test_iterations, start, min(start + chunk_size, n_iter)): start
+                   for start in range(0, n_iter, chunk_size)}
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            records = future.result()
+            chunks[futures[future]] = records
+            if not records[-1][2] and (first_failure is None or records[-1][0] < first_failure):
+                first_failure = records[-1][0]
+                for other, start in futures.items():
+                    if start > first_failure:
+                        other.cancel()
+    records = [record for start in sorted(chunks) for record in chunks[start]]
+    if first_failure is not None:
+        records = [record for record in records if record[0] < first_failure]
+    return records, first_failure
+
 def execute_tests(func,
                   ex_name,
                   key,
                   n_iter,
                   hidden=False,
                   conf_path='resource/asnlib/publicdata/assignment_config.yaml',
-                  path = 'resource/asnlib/publicdata/'):
+                  path = 'resource/asnlib/publicdata/',
+                  return_stats=False,
+                  trace_path=None,
+                  n_workers=None):
     from time import time
     ex_start = time()
-    from cse6040_devkit.tester_fw.testers import Tester
-    from yaml import safe_load
+    from cse6040_devkit.tester_fw.testers import Tester, load_exercise_config
     if hidden: path += 'encrypted/'
-    with open(conf_path) as f:
-        ex_conf = safe_load(f)['exercises'][ex_name]['config']
+    ex_conf = load_exercise_config(conf_path, ex_name)
     ex_conf['func'] = func
     tester = Tester(ex_conf, key, path)
-    for i in range(n_iter):
-        try:
-            tester.run_test()
+    budget = ex_conf.get('time_budget')
+    if budget:
+        # Run distinct cases, starting with those which have not passed yet, until the next one would overrun the budget
+        tester.prioritize_unpassed()
+        n_iter = min(n_iter, budget.get('max_cases', n_iter), len(tester.cases))
+        min_cases = min(budget.get('min_cases', 1), n_iter)
+        deadline = ex_start + budget['seconds']
+    passed, test_case_vars, e = True, tester.get_test_vars(), None
+    trace = open(trace_path, 'a') if trace_path else None
+    def write_trace(iteration, case_index, passed, phase_times):
+        if trace:
+            trace.write(json.dumps({'ex_name': ex_name, 'hidden': hidden, 'iteration': iteration, 'case': case_index,
+                                    'passed': passed, 'phase_times': phase_times}) + '\n')
+    first_serial = 0
+    executor = None
+    if n_workers and (n_workers > 1) and (n_iter > 1) and not budget:
+        executor = cse6040_devkit.utils.fork_executor(min(n_workers, n_iter), _init_test_worker, (tester,))
+    try:
+        if executor is not None:
+            # Iterations run in forked workers up to the first failure. That iteration (or the last one when all pass)
+            # is run again below, so the result and `test_case_vars` are the same as when every iteration runs here.
+            records, first_failure = _run_iterations_in_pool(executor, n_iter, min(n_workers, n_iter))
+            first_serial = n_iter - 1 if first_failure is None else first_failure
+            for iteration, case_index, case_passed, phase_times in records[:first_serial]:
+                tester.mark_passed(case_index)
+                tester.add_phase_times(phase_times)
+                write_trace(iteration, case_index, case_passed, phase_times)
+            tester.case_position = first_serial
+        loop_start = time()
+        for i in range(first_serial, n_iter):
+            # With `min_cases: 0` nothing has run yet at i == 0, so only a budget which is already spent stops the loop
+            if budget and i >= min_cases and time() + (time() - loop_start) / max(i, 1) > deadline:
+                break
+            try:
+                tester.run_test()
+            except Exception as exc:
+                passed, e = False, exc
             test_case_vars = tester.get_test_vars()
-        except Exception as e:
-            test_case_vars = tester.get_test_vars()
-            print(f'{ex_name} test ran {i} iterations in {time() - ex_start:.2f} seconds')
-            return False, test_case_vars, e
+            write_trace(i, tester.case_index, passed, tester.last_phase_times)
+            if not passed:
+                break
+        else:
+            i = n_iter
+    finally:
+        if trace:
+            trace.close()
     print(f'{ex_name} test ran {i} iterations in {time() - ex_start:.2f} seconds')
-    return True, test_case_vars, None
+    if budget and passed:
+        print(f'{ex_name} test covered {i} of {len(tester.cases)} cases within the {budget["seconds"]} second budget. {tester.n_passed()} distinct cases have passed in this session.')
+    if return_stats:
+        return passed, test_case_vars, e, tester.get_phase_stats()
+    return passed, test_case_vars, e
 
 class AssignmentBlueprint():
     def __init__(self,
@@ -79,7 +199,8 @@ class AssignmentBlueprint():
             self.keys = {
                 'visible_key': Fernet.generate_key(),
                 'hidden_key': Fernet.generate_key(),
-                'rng_seed': randint(1000, 9999)
+                'rng_seed': randint(1000, 9999),
+                'per_case_seeds': True
             }
             with open(self.keys_path, 'wb') as f:
                 dill.dump(self.keys, f)
@@ -297,7 +418,7 @@ class AssignmentBlueprint():
         '''
         return self.register_notebook_function(ex_name, 'helper')
     
-    def register_sampler(self, ex_name, sol_func, n_cases, output_names, plugin='', extra_param_names=None, include_hidden=None, **plugin_kwargs):
+    def register_sampler(self, ex_name, sol_func, n_cases, output_names, plugin='', extra_param_names=None, include_hidden=None, serialize_db=False, **plugin_kwargs):
         '''Decorator factory which registers a function as a sampler for the exercise identified by `ex_name`.
         **Inputs**
         - ex_name (str): identifies the exercise to which the sampler is being registered
@@ -307,6 +428,7 @@ class AssignmentBlueprint():
         - plugin (str) (optional): Name of a built-in or registered plugin to use for the test cases. Defaults to an empty string.
         - extra_param_names (list[str]) (optional): List of parameters required by a plugin decorated but not the original solution function. Defaults to None.
         - include_hidden (bool) (optional): Whether to include the hidden test in the notebook. Defaults to True.
+        - serialize_db (bool) (optional): Whether to store a database connection input in the test cases as the bytes of the SQLite database the solution was run against instead of a dict of DataFrames. Defaults to False.
         - plugin_kwargs: Additional named arguments are passed as keyword args to the plugin decorator
 
         **Effects on registration**:
@@ -335,19 +457,26 @@ class AssignmentBlueprint():
             else:
                 self.core[ex_name]['test']['include_hidden'] = self.include_hidden
             seed = self.keys['rng_seed']
+            # Keys files written before per-case seeding existed don't have the flag. They keep one RNG stream per exercise so their cases don't change.
+            seed_kwargs = {'per_case_seeds': self.keys.get('per_case_seeds', False),
+                           'seed_key': (zlib.crc32(ex_name.encode()),),
+                           'serialize_db': serialize_db}
 
             if plugin:
                 if plugin not in dir(cse6040_devkit.plugins):
                     raise ModuleNotFoundError(f'The plugin {plugin} is not defined in the plugins file.')
                 plugged_in_name = f'plugins.{plugin}({_sol_func_name}{", **plugin_kwargs" if plugin_kwargs else ""})'
                 self.core[ex_name]['test']['sol_func_name'] = plugged_in_name
-                tc_gen = SampleGenerator(getattr(cse6040_devkit.plugins, plugin)(sol_func, **plugin_kwargs), sampler_func, output_names, seed=seed)
+                tc_gen = SampleGenerator(getattr(cse6040_devkit.plugins, plugin)(sol_func, **plugin_kwargs), sampler_func, output_names, seed=seed, **seed_kwargs)
             else:
                 self.core[ex_name]['test']['sol_func_name'] = _sol_func_name
-                tc_gen = SampleGenerator(sol_func, sampler_func, output_names, seed=seed)
+                tc_gen = SampleGenerator(sol_func, sampler_func, output_names, seed=seed, **seed_kwargs)
             tc_gen.make_inputs() # needed to set the db_key below
             self.core[ex_name]['test']['db_key'] = tc_gen.db_key
             self.core[ex_name]['test']['tc_gen'] = tc_gen
+            self.core[ex_name]['test']['sampler_func'] = sampler_func
+            self.core[ex_name]['test']['sol_func'] = sol_func
+            self.core[ex_name]['test']['plugin'] = plugin
             self.core[ex_name]['test']['visible_key'] = self.keys['visible_key']
             self.core[ex_name]['test']['hidden_key'] = self.keys['hidden_key']
             self.core[ex_name]['test']['output_names'] = output_names
@@ -386,13 +515,17 @@ class AssignmentBuilder(AssignmentBlueprint):
                  publicdata_path='resource/asnlib/publicdata',
                  kernelspec={'kernelspec': {"display_name": "Python 3.8",
                                             "language": "python",
-                                            "name": "python38"}}):
+                                            "name": "python38"}},
+                 cache_path='build_cache.json',
+                 serializer='dill'):
         """Assignment Builders are an extension of blueprints. In addition to being able to register components, AssignmentBuilders can register other blueprints and build all of the components into a Jupyter notebook.
 
         Args:
             config_path (str, optional): Path to the configuration file. Defaults to 'resource/asnlib/publicdata/assignment_config.yaml'.
             notebook_path (str, optional): Path to the target notebook. Defaults to 'main.ipynb'.
             keys_path (str, optional): Name of the file where encryption keys are stored. Defaults to 'keys.dill'.
+            cache_path (str, optional): Path to the build cache which records the inputs used to generate each exercise's test case files. Defaults to 'build_cache.json'.
+            serializer (str, optional): Serializer for test cases, preload objects and plugin kwargs (see `test_case.serializers`). 'pickle5' and 'columnar' are much faster than dill for data, but the notebook's environment needs a version of cse6040_devkit which can read it. Defaults to 'dill'.
         """
 
         logger.info(f'''Constructing AssignmentBuilder''')
@@ -401,7 +534,7 @@ class AssignmentBuilder(AssignmentBlueprint):
         self.notebook_path = notebook_path
         self.header = header
         self.kernelspec = kernelspec
-        logger.info(f'\n{config_path=}\n{notebook_path=}\n{header=}\n{include_hidden=}\n{kernelspec}')
+        logger.info(f'\n{config_path=}\n{notebook_path=}\n{header=}\n{include_hidden=}\n{kernelspec}\n{serializer=}')
         if os.path.exists(notebook_path):
             logger.info(f'Loading notebook from file')
             with open(notebook_path) as f:
@@ -413,6 +546,8 @@ class AssignmentBuilder(AssignmentBlueprint):
         self.env = Environment(loader=PackageLoader('cse6040_devkit'))
         self.data_path = data_path
         self.publicdata_path = publicdata_path
+        self.cache_path = cache_path
+        self.serializer = serializer
 
     def _load_config_from_file(self):
         if os.path.exists(self.config_path):
@@ -557,6 +692,7 @@ class AssignmentBuilder(AssignmentBlueprint):
                         'check_col_dtypes': True,
                         'check_col_order': True,
                         'check_row_order': False,
+                        'df_compare': 'sort',
                         'float_tolerance': 0.000001
                     }
                 for i, var_name in enumerate(ex_test['output_names'])}
@@ -566,12 +702,6 @@ class AssignmentBuilder(AssignmentBlueprint):
                     'outputs': outputs
                     }
                 logger.info(f"Default test configuration values for exercise {ex_name} set")
-                plugin_kwargs = ex_test.get('plugin_kwargs')
-                if plugin_kwargs:
-                    logger.info(f"Serializing plugin kwarg mapping")
-                    with open(f'resource/asnlib/publicdata/{ex_name}_plugin_kwargs', 'wb') as f:
-                        dill.dump(plugin_kwargs, f)
-                    logger.info(f"Plugin kwarg mapping persisted")
                 logger.info(f"Updating exercise {ex_name} with values from file.")
             temp_exercise.update(self.config['exercises'].get(ex_name, {}))
             ###
@@ -588,6 +718,9 @@ class AssignmentBuilder(AssignmentBlueprint):
         with open(self.config_path, 'w') as f:
             yaml.safe_dump(self.config, f, sort_keys=False)
         logger.info(f"Config persisted in {self.config_path}")
+        from cse6040_devkit.tester_fw.testers import write_exercise_configs
+        write_exercise_configs(self.config_path, self.config['exercises'])
+        logger.info(f"Exercise config sidecars written next to {self.config_path}")
         try:
             logger.info("Creating symlink to config file in working directory")
             os.symlink(self.config_path, 'assignment_config.yaml')
@@ -702,22 +835,128 @@ class AssignmentBuilder(AssignmentBlueprint):
             self.core_cells[f'{ex_name}.test'] = test_cell
         return deepcopy(self.core_cells)
     
-    def _write_artifact_files(self):
+    def _load_build_cache(self):
+        if os.path.exists(self.cache_path):
+            logger.info(f'Loading build cache from {self.cache_path}')
+            with open(self.cache_path) as f:
+                return json.load(f)
+        logger.info('Build cache not found')
+        return {}
+
+    def _case_cache_key(self, test):
+        """Computes a digest of everything which determines the contents of an exercise's test case files.
+
+        Returns None when the case files can't safely be reused. This is the case when the sampler does not take an `rng` (it may draw from global random state shared with other exercises) or when some source code can't be found.
+        """
+        tc_gen = test['tc_gen']
+        if not getattr(tc_gen, 'sampler_takes_rng', False):
+            return None
+        def source_of(obj):
+            if isinstance(obj, str):
+                return str(obj)
+            return inspect.getsource(obj)
+        try:
+            plugin = test.get('plugin', '')
+            plugin_kwargs = test.get('plugin_kwargs', {})
+            parts = {
+                'devkit_version': _devkit_version(),
+                'case_file_format': CASE_FILE_FORMAT_VERSION,
+                'serializer': self.serializer,
+                'sampler': source_of(test['sampler_func']),
+                'solution': source_of(test['sol_func']),
+                'plugin': plugin,
+                'plugin_source': source_of(getattr(cse6040_devkit.plugins, plugin)) if plugin else '',
+                'plugin_kwargs': {k: source_of(v) if callable(v) else repr(v)
+                                  for k, v in sorted(plugin_kwargs.items())},
+                'output_names': list(test['output_names']),
+                'n_cases': test['n_cases'],
+                'seed': repr(tc_gen.seed),
+                'per_case_seeds': tc_gen.per_case_seeds,
+                'seed_key': list(tc_gen.seed_key),
+                'serialize_db': tc_gen.serialize_db,
+                'visible_key': hashlib.sha256(self.keys['visible_key']).hexdigest(),
+                'hidden_key': hashlib.sha256(self.keys['hidden_key']).hexdigest(),
+            }
+        except (OSError, TypeError) as e:
+            logger.info(f'Unable to compute a cache key: {e}')
+            return None
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def _write_exercise_artifacts(self, ex_name, write_cases, n_workers=None):
+        ex = self.core[ex_name]
+        test = ex.get('test')
+        if write_cases:
+            logger.info(f"Writing test case files for {ex_name}")
+            tc_gen = test['tc_gen']
+            tc_gen.write_cases(test['visible_path'], test['n_cases'], key=self.keys['visible_key'], n_workers=n_workers, stream=0, serializer=self.serializer)
+            tc_gen.write_cases(test['hidden_path'], test['n_cases'], key=self.keys['hidden_key'], n_workers=n_workers, stream=1, serializer=self.serializer)
+        plugin_kwargs = (test or {}).get('plugin_kwargs')
+        if plugin_kwargs:
+            logger.info(f"Serializing plugin kwarg mapping for {ex_name}")
+            with open(f'resource/asnlib/publicdata/{ex_name}_plugin_kwargs', 'wb') as f:
+                if self.serializer == 'dill':
+                    dill.dump(plugin_kwargs, f)
+                else:
+                    from cse6040_devkit.test_case.serializers import write_object
+                    write_object(f, plugin_kwargs, self.serializer)
+            logger.info(f"Plugin kwarg mapping persisted")
+        preload_objects = ex.get('preload_objects')
+        if preload_objects:
+            for obj_name, obj in preload_objects.items():
+                logger.info(f"Writing preload object file {obj_name} for {ex_name}")
+                cse6040_devkit.utils.dump_object_to_publicdata(obj, obj_name, self.serializer)
+
+    def _schedule_exercise_artifacts(self, case_writes, n_workers=None):
+        """Writes the artifact files of every exercise.
+
+        When more than one exercise needs new test cases and `n_workers` is greater than 1, each exercise is handled by its own task in a pool of forked workers. The cases of an exercise are generated serially within its task. When only one exercise needs new cases, that exercise's cases are spread over the workers instead.
+        """
+        n_case_writes = sum(case_writes.values())
+        executor = None
+        if n_workers and (n_workers > 1) and (n_case_writes > 1):
+            executor = cse6040_devkit.utils.fork_executor(min(n_workers, n_case_writes), _init_artifact_worker, (self,))
+        if executor is None:
+            for ex_name, write_cases in case_writes.items():
+                self._write_exercise_artifacts(ex_name, write_cases, n_workers)
+            return
+        # Submit the exercises with the most cases to generate first so the slowest ones start right away.
+        ordered = sorted(case_writes,
+                         key=lambda ex_name: self.core[ex_name]['test']['n_cases'] if case_writes[ex_name] else 0,
+                         reverse=True)
+        logger.info(f"Writing artifact files for {len(ordered)} exercises with {min(n_workers, n_case_writes)} workers")
+        with executor:
+            futures = [executor.submit(_write_exercise_artifacts_in_worker, ex_name, case_writes[ex_name]) for ex_name in ordered]
+            for future in futures:
+                future.result()
+
+    def _write_artifact_files(self, n_workers=None, force=False):
         logger.info(f"Writing artifact files")
+        build_cache = self._load_build_cache()
+        new_build_cache = {}
+        case_writes = {}
+        cache_keys = {}
         for ex_name, ex in self.core.items():
             test = ex.get('test')
+            case_writes[ex_name] = False
             if test and (not ex.get('free', False)):
-                logger.info(f"Writing test case files for {ex_name}")
-                tc_gen = test['tc_gen']
-                tc_gen.write_cases(test['visible_path'], test['n_cases'], key=self.keys['visible_key'])
-                tc_gen.write_cases(test['hidden_path'], test['n_cases'], key=self.keys['hidden_key'])
+                case_paths = (test['visible_path'], test['hidden_path'])
+                cache_key = self._case_cache_key(test)
+                cached = build_cache.get(ex_name, {})
+                if (not force) and (cache_key is not None) \
+                    and (cached.get('key') == cache_key) \
+                    and all(cached.get('files', {}).get(path) == _file_stamp(path) for path in case_paths):
+                    logger.info(f"Test case files for {ex_name} are up to date. Reusing them.")
+                else:
+                    case_writes[ex_name] = True
+                if cache_key is not None:
+                    cache_keys[ex_name] = cache_key
             else:
                 logger.info(f"No test cases to write for {ex_name}")
-            preload_objects = ex.get('preload_objects')
-            if preload_objects:
-                for obj_name, obj in preload_objects.items():
-                    logger.info(f"Writing preload object file {obj_name} for {ex_name}")
-                    cse6040_devkit.utils.dump_object_to_publicdata(obj, obj_name)
+        self._schedule_exercise_artifacts(case_writes, n_workers)
+        for ex_name, cache_key in cache_keys.items():
+            test = self.core[ex_name]['test']
+            new_build_cache[ex_name] = {'key': cache_key,
+                                        'files': {path: _file_stamp(path) for path in (test['visible_path'], test['hidden_path'])}}
         logger.info("Writing 'execute_tests' file.")
         cse6040_devkit.utils.dump_object_to_publicdata(execute_tests, 'execute_tests')
         for _, funcs in self.included.items():
@@ -726,10 +965,13 @@ class AssignmentBuilder(AssignmentBlueprint):
                 new_func.__module__ = '__main__'
                 logger.info(f"Writing '{func_name}' file.")
                 cse6040_devkit.utils.dump_object_to_publicdata(new_func, func_name)
+        with open(self.cache_path, 'w') as f:
+            json.dump(new_build_cache, f, indent=2)
+        logger.info(f"Build cache persisted in {self.cache_path}")
         logger.info("Artifact files successfully written.")
                 
 
-    def build(self):
+    def build(self, n_workers=None, force=False):
         """Builds an assignment based on the components registered to the builder. The target notebook will be cleared of output, execution count, and environment metadata.
 
         These steps are executed upon build
@@ -740,10 +982,14 @@ class AssignmentBuilder(AssignmentBlueprint):
             - Any non-core cells are maintained as-is
             - The current sequence of cells is maintained as-is
             - Any new core cells are appended to the end of the target notebook
+
+        Args:
+            n_workers (int, optional): Number of worker processes used to write artifact files. Exercises are handled in parallel when more than one needs new test cases, otherwise the cases of the one exercise are split among the workers. Defaults to None, which does everything serially. The decrypted case files are the same either way.
+            force (bool, optional): Regenerate every test case file even if the build cache shows it is up to date. Defaults to False.
         """
         self._load_config_from_file()
         self._update_config_from_core()
-        self._write_artifact_files()
+        self._write_artifact_files(n_workers, force)
         core_cells = self._build_core_cells()
         final_nb = nbf.v4.new_notebook()
         logger.info(f"Iterating over cells in {self.notebook_path}")
@@ -0,0 +1,360 @@
+'''
+Batch grading of student submissions.
+
+Each submission is run in its own forked worker process, which exits after grading it. The test cells come from the reference notebook built by `AssignmentBuilder`, so edits a student made to their own test cells have no effect. Every case file is decrypted once in the grading process before the workers start. Workers inherit the decrypted frames (see the payload cache in `test_case.case_file`), so no worker decrypts a case file again. With `shared_memory=True` the cases are decoded once into shared memory instead (see `test_case.shared_store`), so workers don't unpickle them either.
+'''
+import os
+
+def _grade_in_worker(path, context, conn):
+    # Runs in the forked process for one submission and sends its rows back through `conn`
+    os.chdir(context['assignment_path'])
+    conn.send(grade_submission(path, context['tests'], context['setup'], context['timeout'], context['quiet']))
+    conn.close()
+
+def _failed_rows(path, tests, error):
+    return [{'submission': os.path.basename(path), 'exercise': ex_name, 'passed': False, 'seconds': 0.0, 'error': error}
+            for ex_name in tests]
+
+def load_reference_notebook(notebook_path='main.ipynb'):
+    '''Reads the test and setup cells of the notebook at `notebook_path`.
+
+    Returns:
+        dict: Maps exercise names to the source of their test cells, in notebook order.
+        list[str]: Source of the global imports and preload cells, in notebook order.
+    '''
+    import nbformat
+    nb = nbformat.read(notebook_path, as_version=4)
+    tests = dict()
+    setup = []
+    for tag, source in _code_cells(nb):
+        if tag and tag.endswith('.test'):
+            tests[tag[:-len('.test')]] = source
+        elif tag == 'main.global_imports' or (tag and tag.endswith('.preload_objects')):
+            setup.append(source)
+    return tests, setup
+
+def _code_cells(nb):
+    for cell in nb.cells:
+        if cell.cell_type != 'code':
+            continue
+        tags = cell.metadata.get('tags')
+        yield (tags[0] if tags else None), cell.source
+
+def load_submission_cells(path):
+    '''Returns the code of a submission as a list of `(tag, source)` pairs, one for each code cell of a notebook. A `.py` file is one untagged cell.'''
+    if path.endswith('.ipynb'):
+        import nbformat
+        return list(_code_cells(nbformat.read(path, as_version=4)))
+    with open(path) as f:
+        return [(None, f.read())]
+
+def _strip_magics(source):
+    # IPython magics and shell escapes are not Python. IPython turns them into calls on `get_ipython()`, which `_Shell` answers.
+    try:
+        from IPython.core.inputtransformer2 import TransformerManager
+    except ImportError:
+        return _strip_top_level_magics(source)
+    return TransformerManager().transform_cell(source)
+
+def _strip_top_level_magics(source):
+    # Without IPython, a line is dropped only if it starts a statement and isn't Python on its own, so continuation lines such as `% 3)` are kept
+    import codeop
+    kept = []
+    for line in source.splitlines():
+        if line.lstrip().startswith(('%', '!')) and not _parses(line.strip()):
+            try:
+                at_statement = codeop.compile_command('\n'.join(kept), symbol='exec') is not None
+            except (SyntaxError, ValueError, OverflowError):
+                at_statement = False
+            if at_statement:
+                line = ''
+        kept.append(line)
+    return '\n'.join(kept)
+
+def _parses(source):
+    import ast
+    try:
+        ast.parse(source)
+    except SyntaxError:
+        return False
+    return True
+
+class _Shell:
+    # Stands in for the IPython shell in transformed cells. Magics and shell commands do nothing, except that the code
+    # which `%time`, `%%time` and the like would measure or capture is still run once.
+    _RUNS_CODE = {'time', 'timeit', 'prun', 'capture'}
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    def run_line_magic(self, name, line, _stack_depth=1):
+        # Options such as `%timeit -n 10 f()` make the line something other than Python, and it is then skipped
+        if name in self._RUNS_CODE and _parses(line):
+            exec(compile(line, f'<%{name}>', 'exec'), self.namespace)
+
+    def run_cell_magic(self, name, line, cell):
+        if name in self._RUNS_CODE:
+            exec(compile(_strip_magics(cell), f'<%%{name}>', 'exec'), self.namespace)
+
+    def system(self, cmd):
+        pass
+
+    def getoutput(self, cmd, split=True):
+        return []
+
+def grade_submission(path, tests, setup=(), timeout=None, quiet=True):
+    '''Runs the code cells of one submission in order and the test for each exercise in place of its test cell.
+
+    Tests whose cell is missing from the submission run after the last cell. A cell which raises is skipped, as it would be in a notebook, so only the exercises which depend on it fail. This runs untrusted code in the calling process, so `grade_submissions` calls it in a separate worker for each submission.
+
+    Args:
+        path (str): Path of a `.ipynb` or `.py` submission.
+        tests (dict): Maps exercise names to test cell source (see `load_reference_notebook`).
+        setup (list[str], optional): Source run before a `.py` submission, since it has none of the notebook's import and preload cells (see `load_reference_notebook`). Defaults to ().
+        timeout (float, optional): Seconds allowed for the whole submission. Exercises not tested in time fail. Defaults to None, which sets no limit.
+        quiet (bool, optional): Discard anything the submission prints. Defaults to True.
+
+    Returns:
+        list[dict]: One row for each exercise with the `submission` file name, `exercise`, `passed`, `seconds` and `error`.
+    '''
+    from contextlib import redirect_stdout, redirect_stderr, ExitStack
+    from time import perf_counter
+    from cse6040_devkit.tester_fw.test_utils import resource_limits, CaseTimeout
+    name = os.path.basename(path)
+    namespace = {'__name__': '__main__'}
+    shell = _Shell(namespace)
+    namespace['get_ipython'] = lambda: shell
+    pending = dict(tests)
+    rows = []
+    def run_test(ex_name):
+        source = pending.pop(ex_name)
+        start = perf_counter()
+        passed, error = False, ''
+        try:
+            exec(compile(source, f'<{ex_name}.test>', 'exec'), namespace)
+            passed = True
+        except CaseTimeout:
+            error = f'The submission did not finish within {timeout} seconds.'
+            raise
+        except BaseException as e:
+            error = f'{type(e).__name__}: {e}'
+        finally:
+            rows.append({'submission': name, 'exercise': ex_name, 'passed': passed,
+                         'seconds': perf_counter() - start, 'error': error})
+    with ExitStack() as stack:
+        if quiet:
+            devnull = stack.enter_context(open(os.devnull, 'w'))
+            stack.enter_context(redirect_stdout(devnull))
+            stack.enter_context(redirect_stderr(devnull))
+        try:
+            with resource_limits(timeout=timeout):
+                cells = load_submission_cells(path)
+                if not path.endswith('.ipynb'):
+                    cells = [(None, source) for source in setup] + cells
+                for tag, source in cells:
+                    if tag and tag.endswith('.test'):
+                        ex_name = tag[:-len('.test')]
+                        if ex_name in pending:
+                            run_test(ex_name)
+                        continue
+                    try:
+                        exec(compile(_strip_magics(source), name, 'exec'), namespace)
+                    except CaseTimeout:
+                        raise
+                    except BaseException:
+                        # includes SystemExit from a call to exit() in the submission
+                        pass
+                for ex_name in list(pending):
+                    run_test(ex_name)
+        except CaseTimeout:
+            pass
+        except Exception as e:
+            # The submission itself could not be read
+            rows.append({'submission': name, 'exercise': '', 'passed': False, 'seconds': 0.0, 'error': f'{type(e).__name__}: {e}'})
+    for ex_name in pending:
+        rows.append({'submission': name, 'exercise': ex_name, 'passed': False, 'seconds': 0.0,
+                     'error': f'The submission did not finish within {timeout} seconds.'})
+    return rows
+
+def prewarm_case_files(keys, conf_path='resource/asnlib/publicdata/assignment_config.yaml', path='resource/asnlib/publicdata/', cache_budget=None):
+    '''Decrypts every visible and hidden case file named in the config into the payload cache of this process.
+
+    Args:
+        keys (dict): Maps `'visible_key'` and `'hidden_key'` to decryption keys.
+        conf_path (str, optional): Path of the assignment config file. Defaults to 'resource/asnlib/publicdata/assignment_config.yaml'.
+        path (str, optional): Directory of the visible case files. Hidden case files are in its `encrypted/` subdirectory. Defaults to 'resource/asnlib/publicdata/'.
+        cache_budget (int, optional): Byte budget for the payload cache. Defaults to None, which uses the total size of the case files. Encrypted frames are larger than the decrypted ones, so everything fits.
+
+    Returns:
+        list[str]: Paths of the case files which were decrypted.
+    '''
+    from cse6040_devkit.test_case.case_file import CaseFile, set_payload_cache_budget
+    case_files = _case_files(keys, conf_path, path)
+    if cache_budget is None:
+        cache_budget = sum(os.path.getsize(case_path) for case_path, _ in case_files)
+    set_payload_cache_budget(cache_budget)
+    for case_path, key in case_files:
+        cases = CaseFile(case_path, key)
+        if cases.framed:
+            for idx in range(len(cases)):
+                cases.payload(idx)
+            for idx in range(len(cases.segments or ())):
+                cases.segment(idx)
+        else:
+            len(cases)
+    return [case_path for case_path, _ in case_files]
+
+def share_case_files(keys, conf_path='resource/asnlib/publicdata/assignment_config.yaml', path='resource/asnlib/publicdata/'):
+    '''Decodes every visible and hidden case file named in the config into a shared memory block (see `test_case.shared_store`).
+
+    Testers created in this process, or in processes forked from it afterwards, read their cases from the blocks. The arrays in the cases are then in memory once however many workers there are.
+
+    Args:
+        keys (dict): Maps `'visible_key'` and `'hidden_key'` to decryption keys.
+        conf_path (str, optional): Path of the assignment config file. Defaults to 'resource/asnlib/publicdata/assignment_config.yaml'.
+        path (str, optional): Directory of the visible case files. Hidden case files are in its `encrypted/` subdirectory. Defaults to 'resource/asnlib/publicdata/'.
+
+    Returns:
+        list[SharedCaseStore]: The stores. Call `unlink` on each of them when grading is done.
+    '''
+    from cse6040_devkit.test_case.shared_store import SharedCaseStore
+    stores = []
+    try:
+        for case_path, key in _case_files(keys, conf_path, path):
+            stores.append(SharedCaseStore.create(case_path, key))
+    except BaseException:
+        for store in stores:
+            store.unlink()
+        raise
+    return stores
+
+def _case_files(keys, conf_path, path):
+    # (path, key) of every case file named in the config which exists
+    import yaml
+    with open(conf_path) as f:
+        exercises = yaml.safe_load(f).get('exercises', {})
+    case_files = []
+    for ex in exercises.values():
+        case_file = (ex.get('config') or {}).get('case_file')
+        if not case_file:
+            continue
+        for case_path, key in ((f'{path}{case_file}', keys['visible_key']), (f'{path}encrypted/{case_file}', keys['hidden_key'])):
+            if os.path.exists(case_path):
+                case_files.append((case_path, key))
+    return case_files
+
+def write_report(report, report_path):
+    '''Writes a grading report to CSV, or to the `grades` table of a SQLite database when `report_path` ends in `.db`, `.sqlite` or `.sqlite3`.'''
+    if report_path.endswith(('.db', '.sqlite', '.sqlite3')):
+        import sqlite3
+        conn = sqlite3.connect(report_path)
+        try:
+            report.to_sql('grades', conn, if_exists='replace', index=False)
+        finally:
+            conn.close()
+    else:
+        report.to_csv(report_path, index=False)
+
+def grade_submissions(submissions_path,
+                      notebook_path='main.ipynb',
+                      keys_path='keys.dill',
+                      conf_path='resource/asnlib/publicdata/assignment_config.yaml',
+                      report_path='grades.csv',
+                      n_workers=None,
+                      timeout=None,
+                      quiet=True,
+                      assignment_path='.',
+                      shared_memory=False):
+    '''Grades every `.ipynb` and `.py` submission in `submissions_path`.
+
+    Each submission runs in a fresh process forked from this one, so submissions can't affect each other. Case files are decrypted once here before any worker starts. If a worker dies before reporting (e.g. the submission calls `os._exit` or the worker is killed for using too much memory), or stops responding for 30 seconds past `timeout`, every exercise of its submission fails.
+
+    Args:
+        submissions_path (str): Directory holding one notebook or Python file for each student.
+        notebook_path (str, optional): Reference notebook the test cells are taken from. Relative to `assignment_path`. Defaults to 'main.ipynb'.
+        keys_path (str, optional): Path of the key file. Relative to `assignment_path`. Defaults to 'keys.dill'.
+        conf_path (str, optional): Path of the assignment config file. Relative to `assignment_path`. Defaults to 'resource/asnlib/publicdata/assignment_config.yaml'.
+        report_path (str, optional): Where the report is written (see `write_report`). None skips writing it. Defaults to 'grades.csv'.
+        n_workers (int, optional): Number of submissions graded at once. Defaults to None, which uses one worker.
+        timeout (float, optional): Seconds allowed for each submission. Defaults to None, which sets no limit.
+        quiet (bool, optional): Discard anything submissions print. Defaults to True.
+        assignment_path (str, optional): Directory of the built assignment. Tests run with it as the working directory. Defaults to '.'.
+        shared_memory (bool, optional): Decode the case files into shared memory blocks (see `share_case_files`) instead of the payload cache of this process. Workers then share the decoded cases instead of each unpickling their own copy. The blocks are freed when grading is done. Defaults to False.
+
+    Returns:
+        pd.DataFrame: One row for each submission and exercise with the columns `submission`, `exercise`, `passed`, `seconds` and `error`.
+    '''
+    import multiprocessing
+    import multiprocessing.connection
+    import dill
+    import pandas as pd
+    from time import time, monotonic
+    start = time()
+    submissions = sorted(os.path.abspath(os.path.join(submissions_path, fn)) for fn in os.listdir(submissions_path)
+                         if fn.endswith(('.ipynb', '.py')))
+    if report_path is not None:
+        report_path = os.path.abspath(report_path)
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        raise RuntimeError('Batch grading needs the fork start method, which is not available on this platform.')
+    cwd = os.getcwd()
+    os.chdir(assignment_path)
+    stores = []
+    try:
+        with open(keys_path, 'rb') as f:
+            keys = dill.load(f)
+        tests, setup = load_reference_notebook(notebook_path)
+        if shared_memory:
+            stores = share_case_files(keys, conf_path)
+        else:
+            prewarm_case_files(keys, conf_path)
+        context = {'tests': tests, 'setup': setup, 'timeout': timeout, 'quiet': quiet, 'assignment_path': os.getcwd()}
+    finally:
+        os.chdir(cwd)
+    fork = multiprocessing.get_context('fork')
+    # A little longer than the worker's own limit, in case the worker process itself got stuck
+    deadline = None if timeout is None else timeout + 30
+    pending = list(submissions)
+    running = dict()
+    results = dict()
+    try:
+        while pending or running:
+            while pending and len(running) < (n_workers or 1):
+                path = pending.pop(0)
+                receiver, sender = fork.Pipe(duplex=False)
+                process = fork.Process(target=_grade_in_worker, args=(path, context, sender), daemon=True)
+                process.start()
+                # Only the worker holds the sending end, so the pipe reports EOF if the worker dies without sending
+                sender.close()
+                running[path] = (process, receiver, monotonic())
+            wait_for = None
+            if deadline is not None:
+                wait_for = max(0, min(started for _, _, started in running.values()) + deadline - monotonic())
+            ready = multiprocessing.connection.wait([receiver for _, receiver, _ in running.values()], wait_for)
+            for path, (process, receiver, started) in list(running.items()):
+                if receiver in ready:
+                    try:
+                        results[path] = receiver.recv()
+                    except EOFError:
+                        process.join()
+                        results[path] = _failed_rows(path, tests, f'The worker grading this submission exited with code {process.exitcode} before reporting a result.')
+                elif deadline is not None and monotonic() - started >= deadline:
+                    process.kill()
+                    results[path] = _failed_rows(path, tests, 'The worker grading this submission stopped responding.')
+                else:
+                    continue
+                process.join()
+                receiver.close()
+                del running[path]
+        rows = [row for path in submissions for row in results[path]]
+        report = pd.DataFrame(rows, columns=['submission', 'exercise', 'passed', 'seconds', 'error'])
+        if report_path is not None:
+            write_report(report, report_path)
+        print(f'Graded {len(submissions)} submissions in {time() - start:.2f} seconds')
+        return report
+    finally:
+        for process, receiver, _ in running.values():
+            process.kill()
+            process.join()
+            receiver.close()
+        for store in stores:
+            store.unlink()
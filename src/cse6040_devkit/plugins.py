@@ -48,11 +48,12 @@ def error_handler(func):
         return error_raised, result
     return _func
 
-def sql_executor(query_generator):
+def sql_executor(query_generator, compare_in_db=False):
     """Plugin to execute a SQL query. This has the effect of requiring students to construct a SQL query to answer a tabular data exercise 
 
     Args:
         query_generator (function): A function which returns a SQL query as a string. 
+        compare_in_db (bool, optional): When True, return a `tester_fw.test_utils.SQLResult` instead of a DataFrame. The tester then compares the result with the expected rows inside the database instead of reading it into pandas, which keeps memory use low for large results. Defaults to False.
 
     Returns (function):
         - Takes an input `conn` which is a SQL connection as well as all other arguments to `query_generator`.
@@ -64,6 +65,9 @@ def sql_executor(query_generator):
             query = query_generator(*args, **kwargs)
         else:
             query = query_generator
+        if compare_in_db:
+            from .tester_fw.test_utils import SQLResult
+            return SQLResult.from_query(conn, query)
         return pd.read_sql(query, conn)
     return _execute
 
@@ -98,6 +102,8 @@ def coo_plugin(func):
     All arguments are passed directly to the inner function. 
 
     Returns the shape, data, row, and col attributes of the `coo_matrix` returned by the inner function.
+
+    Not needed for new exercises. The tester compares `scipy.sparse` results directly.
     """
     def _func(*args, **kwargs):
         coo_result = func(*args, **kwargs)
@@ -126,16 +126,19 @@ class CaseManager():
                                 func,
                                 ex_name,
                                 n_iter=100,
-                                raise_errors=True):
+                                raise_errors=True,
+                                n_workers=None):
         visible_result = execute_tests(func,
                                        ex_name,
                                        key=self.keys['visible_key'],
-                                       n_iter=n_iter)
+                                       n_iter=n_iter,
+                                       n_workers=n_workers)
         hidden_result = execute_tests(func,
                                        ex_name,
                                        key=self.keys['hidden_key'],
                                        n_iter=n_iter,
-                                       hidden=True)
+                                       hidden=True,
+                                       n_workers=n_workers)
         if raise_errors:
             v_passed, _, v_e = visible_result
             h_passed, _, h_e = hidden_result
@@ -0,0 +1,264 @@
+'''
+Reading and writing encrypted test case files.
+
+Two layouts are supported.
+
+Legacy files are a single Fernet token around `dill.dumps(cases)`.
+
+Framed files are written one case at a time so that neither writing nor reading has to hold every case in memory at once:
+
+    MAGIC | version (1 byte) | frame 0 | frame 1 | ... | index | trailer
+
+- Each frame is a Fernet token around one serialized case.
+- The index is UTF-8 JSON holding the format version, the name of the serializer used for every case (see `test_case.serializers`) and the `[offset, length]` of every frame.
+
+With the `'columnar'` serializer the large arrays and DataFrames of each case are segments (see `test_case.columnar`). Each distinct segment is a Fernet token of its own, written before the first case which uses it. The index then also holds the `[offset, length]` of every segment, and each frame entry lists the segments of its case as a third item.
+- The trailer is the offset and length of the index (two big-endian unsigned 64 bit integers) followed by MAGIC again.
+
+The index is written last so a file can be streamed out without knowing the size of each case ahead of time. Readers find it by seeking to the trailer.
+
+Version 2 added the serializer to the index and version 3 added segments. Version 1 files have no serializer and were written with dill. Files are marked with the lowest version that can describe them, so older readers can still read files written with dill.
+
+Decrypted frames are kept in a process-wide LRU cache, so a test that runs again in the same kernel does not decrypt its cases again. The cache holds bytes rather than cases. Every access still deserializes a fresh copy of the case, so changes a solution makes to its inputs can't leak into later runs.
+'''
+import json
+import struct
+from collections import OrderedDict
+from collections.abc import Sequence
+
+MAGIC = b'\x93CSE6040'
+FORMAT_VERSION = 3
+_TRAILER = struct.Struct('>QQ')
+
+# Maps (path, mtime_ns, size, key digest, frame index) to decrypted frame bytes, least recently used first.
+# The frame index is None for the whole contents of a legacy file and ('segment', index) for a segment.
+_payload_cache = OrderedDict()
+_payload_cache_bytes = 0
+_payload_cache_budget = 256 * 2**20
+
+def set_payload_cache_budget(n_bytes):
+    '''Sets the most decrypted bytes kept in the payload cache. 0 disables the cache. Defaults to 256 MiB.'''
+    global _payload_cache_budget
+    _payload_cache_budget = n_bytes
+    _evict_payloads()
+
+def clear_payload_cache():
+    global _payload_cache_bytes
+    _payload_cache.clear()
+    _payload_cache_bytes = 0
+
+def _evict_payloads():
+    global _payload_cache_bytes
+    while _payload_cache and _payload_cache_bytes > _payload_cache_budget:
+        _, payload = _payload_cache.popitem(last=False)
+        _payload_cache_bytes -= len(payload)
+
+def _cached_payload(key):
+    payload = _payload_cache.get(key)
+    if payload is not None:
+        _payload_cache.move_to_end(key)
+    return payload
+
+def _cache_payload(key, payload):
+    global _payload_cache_bytes
+    if key in _payload_cache or len(payload) > _payload_cache_budget:
+        return
+    _payload_cache[key] = payload
+    _payload_cache_bytes += len(payload)
+    _evict_payloads()
+
+def is_framed(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+class CaseFileWriter():
+    def __init__(self, path, key, serializer='dill'):
+        '''Writes a framed case file. Use as a context manager or call `close` when done.
+
+        Args:
+            path (str): Path of the file to write.
+            key (bytes): Fernet key used to encrypt every frame.
+            serializer (str, optional): Name of the serializer the cases were serialized with (see `test_case.serializers`). Recorded in the index for readers. Defaults to 'dill'.
+        '''
+        from cryptography.fernet import Fernet
+        from .serializers import get_serializer
+        get_serializer(serializer)
+        self.fernet = Fernet(key)
+        self.serializer = serializer
+        self.segmented = serializer == 'columnar'
+        self.version = 1 if serializer == 'dill' else 3 if self.segmented else 2
+        self.frames = []
+        self.segments = []
+        # Maps segment digests to positions in `segments`
+        self.segment_ids = dict()
+        self.f_out = open(path, 'wb')
+        self.f_out.write(MAGIC + bytes([self.version]))
+
+    def write(self, payload):
+        '''Encrypts and appends one case serialized with the writer's serializer.'''
+        if not self.segmented:
+            self.frames.append(self._write_token(payload))
+            return
+        from .columnar import split_payload
+        body, segments = split_payload(payload)
+        segment_ids = [self._write_segment(segment) for segment in segments]
+        self.frames.append([*self._write_token(bytes(body)), segment_ids])
+
+    def _write_segment(self, segment):
+        # Identical segments are only written the first time
+        import hashlib
+        digest = hashlib.sha256(segment).digest()
+        if digest not in self.segment_ids:
+            self.segment_ids[digest] = len(self.segments)
+            self.segments.append(self._write_token(bytes(segment)))
+        return self.segment_ids[digest]
+
+    def _write_token(self, payload):
+        token = self.fernet.encrypt(payload)
+        offset = self.f_out.tell()
+        self.f_out.write(token)
+        return [offset, len(token)]
+
+    def close(self):
+        if self.f_out.closed:
+            return
+        index = {'version': self.version, 'frames': self.frames}
+        if self.version > 1:
+            index['serializer'] = self.serializer
+        if self.segmented:
+            index['segments'] = self.segments
+        index = json.dumps(index).encode()
+        index_offset = self.f_out.tell()
+        self.f_out.write(index)
+        self.f_out.write(_TRAILER.pack(index_offset, len(index)) + MAGIC)
+        self.f_out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class CaseFile(Sequence):
+    def __init__(self, path, key):
+        '''Read-only sequence of the cases in a case file of either layout.
+
+        For framed files, each item is decrypted and deserialized when it is accessed, with the serializer named in the index. Iterating streams the frames in order. Legacy files are decrypted in full on first access.
+
+        Args:
+            path (str): Path of the case file.
+            key (bytes): Fernet key used to encrypt the file.
+        '''
+        import hashlib
+        import os
+        from cryptography.fernet import Fernet
+        self.path = path
+        self.fernet = Fernet(key)
+        stat = os.stat(path)
+        # Identifies the file contents and key. Cached payloads are only reused for the same identity.
+        self.identity = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, hashlib.sha256(key).hexdigest())
+        self.framed = is_framed(path)
+        self._legacy_cases = None
+        if self.framed:
+            from .serializers import get_serializer
+            index = self._read_index()
+            self.frames = index['frames']
+            self.serializer = index.get('serializer', 'dill')
+            self.loads = get_serializer(self.serializer)[1]
+            self.segments = index.get('segments')
+
+    def _read_index(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-(_TRAILER.size + len(MAGIC)), 2)
+            trailer = f.read()
+            if trailer[_TRAILER.size:] != MAGIC:
+                raise ValueError(f'{self.path} is truncated or is not a case file.')
+            index_offset, index_length = _TRAILER.unpack(trailer[:_TRAILER.size])
+            f.seek(index_offset)
+            index = json.loads(f.read(index_length))
+        if index['version'] > FORMAT_VERSION:
+            raise ValueError(f'{self.path} uses case file format version {index["version"]}. Upgrade cse6040_devkit to read it.')
+        return index
+
+    def _legacy(self):
+        if self._legacy_cases is None:
+            self._legacy_cases = self._load_legacy()
+        return self._legacy_cases
+
+    def _load_legacy(self):
+        import dill as pickle
+        key = (*self.identity, None)
+        payload = _cached_payload(key)
+        if payload is None:
+            with open(self.path, 'rb') as fin:
+                payload = self.fernet.decrypt(fin.read())
+            _cache_payload(key, payload)
+        return pickle.loads(payload)
+
+    def load_fresh(self, idx):
+        '''Returns a new copy of case `idx`. Items of a legacy file are decoded once and the same objects are returned on every access, so this decodes the file again. For framed files it is the same as `self[idx]`.'''
+        if not self.framed:
+            return self._load_legacy()[idx]
+        return self[idx]
+
+    def payload(self, idx, f=None):
+        '''Decrypted bytes of frame `idx`. Only available for framed files.
+
+        Args:
+            idx (int): Index of the frame.
+            f (file, optional): This case file already open for binary reading. Defaults to None, which opens it only if the frame is not cached.
+        '''
+        return self._decrypt((*self.identity, range(len(self.frames))[idx]), self.frames[idx], f)
+
+    def segment(self, idx, f=None):
+        '''Decrypted bytes of segment `idx`. Only available for files written with the `'columnar'` serializer.
+
+        Args:
+            idx (int): Index of the segment.
+            f (file, optional): This case file already open for binary reading. Defaults to None, which opens it only if the segment is not cached.
+        '''
+        return self._decrypt((*self.identity, ('segment', range(len(self.segments))[idx])), self.segments[idx], f)
+
+    def _decrypt(self, key, entry, f):
+        payload = _cached_payload(key)
+        if payload is not None:
+            return payload
+        if f is None:
+            with open(self.path, 'rb') as f:
+                return self._decrypt(key, entry, f)
+        offset, length = entry[:2]
+        f.seek(offset)
+        payload = self.fernet.decrypt(f.read(length))
+        _cache_payload(key, payload)
+        return payload
+
+    def _load(self, idx, f=None):
+        payload = self.payload(idx, f)
+        if self.segments is None:
+            return self.loads(payload)
+        from .columnar import loads_body
+        return loads_body(payload, [self.segment(i, f) for i in self.frames[idx][2]])
+
+    def __len__(self):
+        if self.framed:
+            return len(self.frames)
+        return len(self._legacy())
+
+    def __getitem__(self, idx):
+        if not self.framed:
+            return self._legacy()[idx]
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        return self._load(idx)
+
+    def __iter__(self):
+        if not self.framed:
+            yield from self._legacy()
+            return
+        with open(self.path, 'rb') as f:
+            for idx in range(len(self.frames)):
+                yield self._load(idx, f)
+
+def read_case_file(path, key):
+    '''Reads every case in a case file of either layout into a list.'''
+    return list(CaseFile(path, key))
@@ -0,0 +1,181 @@
+'''
+Columnar encoding of the NumPy arrays and DataFrames in test cases.
+
+With the `'columnar'` serializer each large array and DataFrame in a case becomes a separate segment, and the rest of the case is pickled with references to them:
+
+- An array is stored as `.npy` bytes (`numpy.save`).
+- A DataFrame is stored as a small pickled header followed by one `.npy` buffer for each NumPy backed column. The header holds the column labels, the index and any columns of other dtypes (object, string, categorical, ...).
+
+Loading reads the buffers straight into arrays instead of going through the pickle machinery for each object.
+
+In a case file the segments are encrypted frames of their own. Identical segments are written once, so a DataFrame or array that appears in many cases is stored and decrypted only once (see `CaseFileWriter`).
+
+A self-contained payload, as returned by `dumps`, is laid out as:
+
+    b'C' | body length (8 bytes) | segment count (4 bytes) | segment lengths (8 bytes each) | body | segments
+'''
+import io
+import pickle
+import struct
+from .serializers import _Pickler
+
+_COLUMNAR = b'C'
+_DILL = b'D'
+_LAYOUT = struct.Struct('>QI')
+_LENGTH = struct.Struct('>Q')
+_ARRAY = b'A'
+_FRAME = b'F'
+# Size of the `.npy` header length field by format version
+_NPY_HEADER_LENGTH = {(1, 0): struct.Struct('<H'), (2, 0): struct.Struct('<I')}
+
+# Smaller objects stay in the body, where they cost less than a segment of their own
+MIN_SEGMENT_BYTES = 1024
+
+def _npy(arr):
+    import numpy as np
+    f = io.BytesIO()
+    np.save(f, arr, allow_pickle=False)
+    return f.getvalue()
+
+def _load_npy(view):
+    # Like `numpy.load`, but copies the data once instead of going through a file object
+    import numpy as np
+    from numpy.lib import format
+    version = format.read_magic(io.BytesIO(view[:format.MAGIC_LEN]))
+    if version not in _NPY_HEADER_LENGTH:
+        # Version 3.0 only differs in the encoding of the header, which np.save only uses for unusual field names
+        return np.load(io.BytesIO(view), allow_pickle=False)
+    header_length, = _NPY_HEADER_LENGTH[version].unpack_from(view, format.MAGIC_LEN)
+    f = io.BytesIO(view[:format.MAGIC_LEN + _NPY_HEADER_LENGTH[version].size + header_length])
+    format.read_magic(f)
+    read_header = format.read_array_header_1_0 if version == (1, 0) else format.read_array_header_2_0
+    shape, fortran_order, dtype = read_header(f)
+    order = 'F' if fortran_order else 'C'
+    count = int(np.prod(shape))
+    if count == 0:
+        return np.empty(shape, dtype=dtype, order=order)
+    return np.frombuffer(view, dtype=dtype, count=count, offset=f.tell()).reshape(shape, order=order).copy(order='K')
+
+def _encode_frame(df):
+    import numpy as np
+    header = {'columns': df.columns, 'index': df.index, 'attrs': df.attrs, 'pickled': dict(), 'lengths': []}
+    buffers = []
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        if isinstance(col.dtype, np.dtype) and not col.dtype.hasobject:
+            buffers.append(_npy(col.to_numpy()))
+            header['lengths'].append(len(buffers[-1]))
+        else:
+            header['pickled'][i] = col.array
+    header = pickle.dumps(header, protocol=5)
+    return b''.join([_FRAME, _LENGTH.pack(len(header)), header, *buffers])
+
+def _decode_frame(view):
+    import pandas as pd
+    header_length, = _LENGTH.unpack_from(view, 1)
+    position = 1 + _LENGTH.size
+    header = pickle.loads(view[position:position + header_length])
+    position += header_length
+    lengths = iter(header['lengths'])
+    data = dict()
+    for i in range(len(header['columns'])):
+        if i in header['pickled']:
+            data[i] = header['pickled'][i]
+        else:
+            length = next(lengths)
+            data[i] = _load_npy(view[position:position + length])
+            position += length
+    df = pd.DataFrame(data, index=header['index'], copy=False)
+    df.columns = header['columns']
+    df.attrs = header['attrs']
+    return df
+
+def encode_segment(obj):
+    '''Returns the segment bytes of a NumPy array or DataFrame.'''
+    import numpy as np
+    if isinstance(obj, np.ndarray):
+        return _ARRAY + _npy(obj)
+    return _encode_frame(obj)
+
+def decode_segment(segment):
+    '''Returns a new array or DataFrame from the bytes of a segment.'''
+    view = memoryview(segment)
+    if view[:1] == _ARRAY:
+        return _load_npy(view[1:])
+    return _decode_frame(view)
+
+def _segment_worthy(obj):
+    import numpy as np
+    import pandas as pd
+    if type(obj) is np.ndarray:
+        return not obj.dtype.hasobject and obj.nbytes >= MIN_SEGMENT_BYTES
+    if type(obj) is pd.DataFrame:
+        return obj.memory_usage(index=False).sum() >= MIN_SEGMENT_BYTES
+    return False
+
+class _ColumnarPickler(_Pickler):
+    # Replaces large arrays and DataFrames with their position in `segments`
+    def __init__(self, file, segments):
+        super().__init__(file, protocol=5)
+        self.segments = segments
+        self.seen = dict()
+
+    def persistent_id(self, obj):
+        if not _segment_worthy(obj):
+            return None
+        if id(obj) not in self.seen:
+            self.seen[id(obj)] = len(self.segments)
+            self.segments.append(encode_segment(obj))
+        return self.seen[id(obj)]
+
+class _ColumnarUnpickler(pickle.Unpickler):
+    def __init__(self, file, segments):
+        super().__init__(file)
+        self.segments = segments
+        self.decoded = dict()
+
+    def persistent_load(self, pid):
+        # An object referenced twice in a case is decoded once, so the loaded case keeps the same sharing
+        if pid not in self.decoded:
+            self.decoded[pid] = decode_segment(self.segments[pid])
+        return self.decoded[pid]
+
+def dumps(obj):
+    from .serializers import _dill_dumps
+    f = io.BytesIO()
+    segments = []
+    try:
+        _ColumnarPickler(f, segments).dump(obj)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return _DILL + _dill_dumps(obj)
+    body = f.getvalue()
+    return b''.join([_COLUMNAR, _LAYOUT.pack(len(body), len(segments)), *(_LENGTH.pack(len(s)) for s in segments), body, *segments])
+
+def split_payload(payload):
+    '''Splits a payload from `dumps` into its body and the list of its segments, as views of `payload`. The body of a value stored whole with dill has no segments.'''
+    view = memoryview(payload)
+    if view[:1] == _DILL:
+        return view, []
+    body_length, n_segments = _LAYOUT.unpack_from(view, 1)
+    position = 1 + _LAYOUT.size
+    lengths = [_LENGTH.unpack_from(view, position + i * _LENGTH.size)[0] for i in range(n_segments)]
+    position += n_segments * _LENGTH.size
+    # Bodies are small, so the tag is simply copied in front
+    body = _COLUMNAR + view[position:position + body_length]
+    position += body_length
+    segments = []
+    for length in lengths:
+        segments.append(view[position:position + length])
+        position += length
+    return body, segments
+
+def loads_body(body, segments):
+    '''Loads a value from its body and segments as returned by `split_payload`.'''
+    from .serializers import _dill_loads
+    view = memoryview(body)
+    if view[:1] == _DILL:
+        return _dill_loads(view[1:])
+    return _ColumnarUnpickler(io.BytesIO(view[1:]), segments).load()
+
+def loads(payload):
+    return loads_body(*split_payload(payload))
@@ -5,3 +5,37 @@ def dfs_to_conn(conn_dfs, index=False):
         # df.rename_axis(index='index').to_sql(table_name, conn, if_exists='replace')
         df.to_sql(table_name, conn, if_exists='replace', index=index)
     return conn
+
+def conn_to_bytes(conn):
+    """Serializes the main database of `conn` into the bytes of an SQLite database file."""
+    if hasattr(conn, 'serialize'):
+        return conn.serialize()
+    # `Connection.serialize` was added in Python 3.11. Go through a temporary file on older versions.
+    import sqlite3
+    import tempfile
+    import os
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, 'image.db')
+        tmp_conn = sqlite3.connect(tmp_path)
+        conn.backup(tmp_conn)
+        tmp_conn.close()
+        with open(tmp_path, 'rb') as f:
+            return f.read()
+
+def bytes_to_conn(data):
+    """Loads bytes created by `conn_to_bytes` into a new in-memory connection."""
+    import sqlite3
+    conn = sqlite3.connect(':memory:')
+    if hasattr(conn, 'deserialize'):
+        conn.deserialize(data)
+        return conn
+    import tempfile
+    import os
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, 'image.db')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        tmp_conn = sqlite3.connect(tmp_path)
+        tmp_conn.backup(conn)
+        tmp_conn.close()
+    return conn
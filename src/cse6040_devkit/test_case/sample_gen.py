@@ -1,24 +1,41 @@
 from .test_case_gen import TestCaseGenerator
-from .input_gen_utils import dfs_to_conn
+from .input_gen_utils import dfs_to_conn, conn_to_bytes
 from warnings import warn
-from numpy.random import default_rng
+from numpy.random import default_rng, SeedSequence
 from inspect import signature
 import logging
 
 logger = logging.getLogger(__name__)
 
 class SampleGenerator(TestCaseGenerator):
-    def __init__(self, test_func, sampler_func, output_names=None, seed=None):
+    input_state_attrs = ('input_data', 'db_key')
+
+    def __init__(self, test_func, sampler_func, output_names=None, seed=None, per_case_seeds=False, seed_key=(), serialize_db=False):
         self.test_func = test_func
+        self.serialize_db = serialize_db
+        self.seed = seed
+        self.per_case_seeds = per_case_seeds
+        self.seed_key = tuple(seed_key)
         n_params = len(signature(sampler_func).parameters)
         if n_params == 1:
-            rng = default_rng(seed=seed)
-            self.sampler_func = lambda: sampler_func(rng)
+            self.rng = default_rng(seed=seed)
+            self.sampler_func = lambda: sampler_func(self.rng)
         elif n_params == 0:
             self.sampler_func = sampler_func
         else:
             raise ValueError(f'A sampler function must take 0 arguments or take one rng argument. The sampler passed takes {n_params} arguments.')
+        self.sampler_takes_rng = (n_params == 1)
         self.output_names = output_names
+
+    @property
+    def independent_cases(self):
+        # Samplers which take no `rng` can't be seeded per case, so they keep drawing from one stream.
+        return self.per_case_seeds and self.sampler_takes_rng
+
+    def seed_case(self, stream, case_idx):
+        if self.independent_cases:
+            seed_seq = SeedSequence(self.seed, spawn_key=(*self.seed_key, stream, case_idx))
+            self.rng = default_rng(seed_seq)
     
     def make_inputs(self):
         sampler_output = self.sampler_func()
@@ -43,7 +60,11 @@ class SampleGenerator(TestCaseGenerator):
             if param != self.db_key:
                 staged_inputs[param] = val
             elif param == self.db_key:
-                staged_inputs[param] = dfs_to_conn(val)
+                conn = dfs_to_conn(val)
+                if self.serialize_db:
+                    # The case stores the database exactly as the solution sees it
+                    self.input_data[param] = conn_to_bytes(conn)
+                staged_inputs[param] = conn
         unnamed_outputs = self.test_func(**staged_inputs)
         if not isinstance(unnamed_outputs, tuple):
             unnamed_outputs = (unnamed_outputs,)
@@ -0,0 +1,135 @@
+'''
+Serializers for test cases and other data files.
+
+- `'dill'` is `dill.dumps` and `dill.loads`. It handles nearly anything, but it pickles in pure Python, which is slow for large data.
+- `'pickle5'` uses the C pickler with protocol 5. The raw data of NumPy arrays, and of pandas objects built on them, is written out-of-band after the pickle instead of being copied into it. Values which the standard pickler can only save by reference but which can't be found by reference when loading (lambdas, nested functions, and functions and classes defined in `__main__`) are pickled with dill inside the same stream. Dill is only used for the values that need it.
+- `'columnar'` uses the same pickler as `'pickle5'`, but large NumPy arrays and DataFrames are stored as separate `.npy` based segments (see `test_case.columnar`). Case files store each distinct segment once.
+
+A `'pickle5'` payload is laid out as:
+
+    b'P' | pickle length (8 bytes) | buffer count (4 bytes) | buffer lengths (8 bytes each) | pickle | buffers
+
+If the C pickler can't serialize a value at all, the whole value is stored as `b'D'` followed by its dill pickle.
+
+Other serializers can be added with `register_serializer`. Readers need the same registration to load the files.
+'''
+import pickle
+import struct
+import sys
+import types
+
+_PICKLE5 = b'P'
+_DILL = b'D'
+_LAYOUT = struct.Struct('>QI')
+_LENGTH = struct.Struct('>Q')
+
+# Header of a data file written by `write_object` with a serializer other than dill
+OBJECT_MAGIC = b'\x93CSEOBJ'
+
+# Maps serializer names to (dumps, loads)
+_serializers = dict()
+
+def register_serializer(name, dumps, loads):
+    '''Makes a serializer available by `name` to case files and data files.
+
+    Args:
+        name (str): Name recorded in the files written with the serializer. Must not contain a newline.
+        dumps (callable): Returns the bytes of one object.
+        loads (callable): Takes a bytes-like object returned by `dumps` and returns a new copy of the object.
+    '''
+    _serializers[name] = (dumps, loads)
+
+def get_serializer(name):
+    '''Returns the `(dumps, loads)` pair registered for `name`.'''
+    try:
+        return _serializers[name]
+    except KeyError:
+        raise ValueError(f'Unknown serializer {name!r}. Available serializers are {", ".join(sorted(_serializers))}.') from None
+
+def dumps(obj, serializer='dill'):
+    return get_serializer(serializer)[0](obj)
+
+def loads(payload, serializer='dill'):
+    return get_serializer(serializer)[1](payload)
+
+def _dill_dumps(obj):
+    import dill
+    return dill.dumps(obj)
+
+def _dill_loads(payload):
+    import dill
+    return dill.loads(payload)
+
+def _by_reference(obj):
+    # Whether `obj` can be found again from its module and qualified name in another process
+    module_name = getattr(obj, '__module__', None)
+    if module_name in (None, '__main__'):
+        return False
+    target = sys.modules.get(module_name)
+    for part in obj.__qualname__.split('.'):
+        target = getattr(target, part, None)
+    return target is obj
+
+class _Pickler(pickle.Pickler):
+    def reducer_override(self, obj):
+        # Only called for objects the C pickler has no fast path for, so plain data doesn't pay for the check
+        if isinstance(obj, (types.FunctionType, type)) and not _by_reference(obj):
+            import dill
+            return _dill_loads, (dill.dumps(obj, recurse=True),)
+        return NotImplemented
+
+def _pickle5_dumps(obj):
+    import io
+    f = io.BytesIO()
+    buffers = []
+    try:
+        _Pickler(f, protocol=5, buffer_callback=buffers.append).dump(obj)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return _DILL + _dill_dumps(obj)
+    raw = [buffer.raw() for buffer in buffers]
+    data = f.getvalue()
+    return b''.join([_PICKLE5, _LAYOUT.pack(len(data), len(raw)), *(_LENGTH.pack(r.nbytes) for r in raw), data, *raw])
+
+def _pickle5_loads(payload):
+    view = memoryview(payload)
+    if view[:1] == _DILL:
+        return _dill_loads(view[1:])
+    data_length, n_buffers = _LAYOUT.unpack_from(view, 1)
+    position = 1 + _LAYOUT.size
+    lengths = [_LENGTH.unpack_from(view, position + i * _LENGTH.size)[0] for i in range(n_buffers)]
+    position += n_buffers * _LENGTH.size
+    data = view[position:position + data_length]
+    position += data_length
+    buffers = []
+    for length in lengths:
+        # Copied so each load gets writable arrays of its own, even when `payload` is cached
+        buffers.append(bytearray(view[position:position + length]))
+        position += length
+    return pickle.loads(data, buffers=buffers)
+
+def _columnar_dumps(obj):
+    from .columnar import dumps
+    return dumps(obj)
+
+def _columnar_loads(payload):
+    from .columnar import loads
+    return loads(payload)
+
+register_serializer('dill', _dill_dumps, _dill_loads)
+register_serializer('pickle5', _pickle5_dumps, _pickle5_loads)
+register_serializer('columnar', _columnar_dumps, _columnar_loads)
+
+def write_object(f, obj, serializer):
+    '''Writes `obj` to the binary file `f` after a header naming `serializer` (see `read_object`).'''
+    f.write(OBJECT_MAGIC + serializer.encode() + b'\n')
+    f.write(dumps(obj, serializer))
+
+def read_object(f):
+    '''Reads an object from the binary file `f`. Files written by `write_object` are decoded with the serializer named in their header. Anything else is read with dill.'''
+    import dill
+    head = f.read(len(OBJECT_MAGIC))
+    if head != OBJECT_MAGIC:
+        f.seek(-len(head), 1)
+        return dill.load(f)
+    serializer = f.readline()[:-1].decode()
+    return loads(f.read(), serializer)
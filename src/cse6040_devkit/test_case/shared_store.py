@@ -0,0 +1,178 @@
+'''
+Test cases decoded once into shared memory.
+
+A `SharedCaseStore` holds every case of a case file in one `multiprocessing.shared_memory` block. NumPy arrays, including the ones inside pandas objects, are stored once as raw data. The rest of each case is kept as a small pickle which refers to them. Reading a case unpickles only that small part and wraps the shared data in read-only arrays without copying it. Any number of processes can then read the cases while the data is in memory once.
+
+Block layout:
+
+    index length (8 bytes, big-endian) | index (UTF-8 JSON) | padding | case pickles and array data
+
+The index holds the identity of the case file, the `[offset, length]` of each case pickle and the `[offset, dtype, shape, fortran_order]` of each array. Offsets are from the end of the padding, which aligns the data to 64 bytes.
+'''
+import io
+import json
+import struct
+from collections.abc import Sequence
+import dill
+import numpy as np
+
+_HEADER = struct.Struct('>Q')
+_ALIGNMENT = 64
+# Smaller arrays stay in the case pickles, where they cost less than an index entry and a view
+MIN_SHARED_BYTES = 1024
+
+# Stores created in this process, keyed by `CaseFile.identity`. Forked workers inherit them (see `open_cases`).
+_registry = dict()
+
+def _aligned(n):
+    return -(-n // _ALIGNMENT) * _ALIGNMENT
+
+def _view(block, offset, dtype, shape, fortran_order, writeable=False):
+    # Array of `dtype` and `shape` over the bytes of `block` starting at `offset`
+    n_bytes = dtype.itemsize * int(np.prod(shape))
+    arr = block[offset:offset + n_bytes].view(dtype).reshape(shape, order='F' if fortran_order else 'C')
+    arr.flags.writeable = writeable
+    return arr
+
+class _SharingPickler(dill.Pickler):
+    # Replaces large NumPy arrays with their position in `arrays`
+    def __init__(self, file, arrays):
+        super().__init__(file)
+        self.arrays = arrays
+        self.seen = dict()
+
+    def persistent_id(self, obj):
+        if type(obj) is not np.ndarray or obj.dtype.hasobject or obj.nbytes < MIN_SHARED_BYTES:
+            return None
+        if id(obj) not in self.seen:
+            self.seen[id(obj)] = len(self.arrays)
+            self.arrays.append(obj)
+        return self.seen[id(obj)]
+
+class _SharingUnpickler(dill.Unpickler):
+    def __init__(self, file, arrays):
+        super().__init__(file)
+        self.arrays = arrays
+
+    def persistent_load(self, pid):
+        return self.arrays[pid]
+
+class SharedCaseStore(Sequence):
+    def __init__(self, shm, owner=False):
+        '''Read-only sequence of the cases in a shared memory block. Use `create` or `attach` rather than calling this directly.
+
+        Arrays in the cases are read-only views of the shared block. Other values are new objects on every access.
+
+        Args:
+            shm (multiprocessing.shared_memory.SharedMemory): The block.
+            owner (bool, optional): Whether this process created the block and should unlink it when done. Defaults to False.
+        '''
+        self.shm = shm
+        self.owner = owner
+        index_length, = _HEADER.unpack(bytes(shm.buf[:_HEADER.size]))
+        index = json.loads(bytes(shm.buf[_HEADER.size:_HEADER.size + index_length]))
+        self.identity = tuple(index['identity'])
+        self.data_offset = _aligned(_HEADER.size + index_length)
+        self.frames = index['cases']
+        # Unlike `np.ndarray(buffer=...)`, `np.frombuffer` holds on to the buffer. The block can't be unmapped while
+        # any array from it is alive, so `close` can't leave arrays pointing at freed memory.
+        block = np.frombuffer(shm.buf, dtype=np.uint8)
+        self.arrays = [_view(block, self.data_offset + offset, np.lib.format.descr_to_dtype(descr), shape, fortran_order)
+                       for offset, descr, shape, fortran_order in index['arrays']]
+
+    @classmethod
+    def create(cls, path, key, name=None, register=True):
+        '''Decodes every case of a case file into a new shared memory block.
+
+        Args:
+            path (str): Path of the case file.
+            key (bytes): Fernet key used to encrypt the file.
+            name (str, optional): Name of the block. Defaults to None, which picks a unique name.
+            register (bool, optional): Make the store available to `open_cases` in this process and in processes forked from it later. Defaults to True.
+
+        Returns:
+            SharedCaseStore: The store, which owns the block. Call `unlink` (or use it as a context manager) when every process is done with it.
+        '''
+        from multiprocessing import shared_memory
+        from .case_file import CaseFile
+        cases = CaseFile(path, key)
+        arrays = []
+        pickles = []
+        for case in cases:
+            f = io.BytesIO()
+            _SharingPickler(f, arrays).dump(case)
+            pickles.append(f.getvalue())
+        frames = []
+        position = 0
+        for payload in pickles:
+            frames.append([position, len(payload)])
+            position += len(payload)
+        array_entries = []
+        for arr in arrays:
+            position = _aligned(position)
+            fortran_order = arr.flags.f_contiguous and not arr.flags.c_contiguous
+            array_entries.append([position, np.lib.format.dtype_to_descr(arr.dtype), list(arr.shape), fortran_order])
+            position += arr.nbytes
+        index = json.dumps({'identity': list(cases.identity), 'cases': frames, 'arrays': array_entries}).encode()
+        data_offset = _aligned(_HEADER.size + len(index))
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(1, data_offset + position))
+        shm.buf[:_HEADER.size] = _HEADER.pack(len(index))
+        shm.buf[_HEADER.size:_HEADER.size + len(index)] = index
+        for (offset, length), payload in zip(frames, pickles):
+            shm.buf[data_offset + offset:data_offset + offset + length] = payload
+        block = np.frombuffer(shm.buf, dtype=np.uint8)
+        for (offset, _, shape, fortran_order), arr in zip(array_entries, arrays):
+            _view(block, data_offset + offset, arr.dtype, shape, fortran_order, writeable=True)[...] = arr
+        del block
+        store = cls(shm, owner=True)
+        if register:
+            _registry[store.identity] = store
+        return store
+
+    @classmethod
+    def attach(cls, name):
+        '''Opens a store created by another process from the name of its block (`store.shm.name`).'''
+        from multiprocessing import shared_memory
+        return cls(shared_memory.SharedMemory(name=name))
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        offset, length = self.frames[idx]
+        start = self.data_offset + offset
+        return _SharingUnpickler(io.BytesIO(self.shm.buf[start:start + length]), self.arrays).load()
+
+    def close(self):
+        '''Stops using the block in this process. If arrays from the store are still referenced, the block stays mapped until the process exits.'''
+        if _registry.get(self.identity) is self:
+            del _registry[self.identity]
+        self.arrays = []
+        try:
+            self.shm.close()
+        except BufferError:
+            # Arrays from the store are still alive and the mapping is released with the last of them. The
+            # SharedMemory would otherwise try to close it again when collected and print the same error.
+            self.shm.close = lambda: None
+
+    def unlink(self):
+        '''Closes the store and frees the block once every process has closed it. Only the process which created the store should call this.'''
+        self.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.owner:
+            self.unlink()
+        else:
+            self.close()
+
+def open_cases(path, key):
+    '''Returns the registered `SharedCaseStore` for the case file at `path` and `key`, or a `CaseFile` when there is none.'''
+    from .case_file import CaseFile
+    cases = CaseFile(path, key)
+    return _registry.get(cases.identity, cases)
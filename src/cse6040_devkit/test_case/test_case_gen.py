@@ -1,32 +1,107 @@
+_worker_generator = None
+
+def _init_case_worker(generator):
+    global _worker_generator
+    _worker_generator = generator
+
+def _make_indexed_case(task):
+    from .serializers import dumps
+    stream, case_idx, serializer = task
+    return dumps(_worker_generator.make_case(case_idx, stream), serializer)
+
+def _make_case_outputs(task):
+    # Runs in a forked worker. `input_state` holds the attributes set by `make_inputs` in the parent.
+    import dill as pickle
+    from .serializers import dumps
+    input_state, serializer = task
+    generator = _worker_generator
+    generator.__dict__.update(pickle.loads(input_state))
+    generator.output_data = generator.make_outputs()
+    return dumps(generator.assemble_case(), serializer)
+
 class TestCaseGenerator():
+    # Attributes set by `make_inputs` which `make_outputs` depends on.
+    # Subclasses which keep additional state between the two calls should extend this.
+    input_state_attrs = ('input_data',)
+    # True when each case can be made on its own from its index (see `seed_case`).
+    independent_cases = False
+
     def __init__(self):
         print(f'initializing {__class__}')
         self.input_data = None
         self.output_data = None
 
-    def make_case(self):
+    def make_case(self, case_idx=None, stream=0):
+        if case_idx is not None:
+            self.seed_case(stream, case_idx)
         self.input_data = self.make_inputs()
         self.output_data = self.make_outputs()
-        arg_names = set(self.input_data.keys()) | set(self.output_data.keys())
+        return self.assemble_case()
+
+    def seed_case(self, stream, case_idx):
+        # Set up any random state needed to make case number `case_idx` of `stream` independently of the other cases.
+        # Generators which can do this should also set `independent_cases` to True.
+        pass
+
+    def assemble_case(self):
+        # dict keys keep a stable order where a set would not, so that rebuilding gives the same file contents
+        arg_names = dict.fromkeys([*self.input_data.keys(), *self.output_data.keys()])
         return {name:self.output_data.get(name, self.input_data.get(name)) for name in arg_names}
 
-    def write_cases(self, path, n_cases=100, key=b'sIRWMgIhwENImJyOel3HWJDMr0VbXzfbq-uwgd09VFs='):
+    def write_cases(self, path, n_cases=100, key=b'sIRWMgIhwENImJyOel3HWJDMr0VbXzfbq-uwgd09VFs=', n_workers=None, stream=0, framed=True, serializer='dill'):
         import dill as pickle
         from cryptography.fernet import Fernet
+        from .case_file import CaseFileWriter
+        from .serializers import loads
         if key is None:
             key = Fernet.generate_key()
+        if framed:
+            with CaseFileWriter(path, key, serializer) as writer:
+                for payload in self.iter_case_payloads(n_cases, n_workers, stream, serializer):
+                    writer.write(payload)
+            return key
+        # Legacy files have no header to record a serializer in, so they are always dill
         fernet = Fernet(key)
-        cases = [self.make_case() for _ in range(n_cases)]
+        cases = [loads(payload, serializer) for payload in self.iter_case_payloads(n_cases, n_workers, stream, serializer)]
         with open(path, 'wb') as f_out:
             f_out.write(fernet.encrypt(pickle.dumps(cases)))
         return key
-    
-    def read_cases(self, path, key=b'sIRWMgIhwENImJyOel3HWJDMr0VbXzfbq-uwgd09VFs='):
+
+    def iter_case_payloads(self, n_cases, n_workers=None, stream=0, serializer='dill'):
+        '''Yields `n_cases` cases, each serialized on its own with `serializer` (see `test_case.serializers`).
+
+        Every case is serialized individually whether it was made in this process or in a worker. That way the file contents do not depend on `n_workers`.
+
+        When `independent_cases` is True, case `i` is made by `make_case(i, stream)` and whole cases are computed in a pool of forked workers if `n_workers` is greater than 1.
+        Otherwise inputs are always sampled in this process so that any random state is consumed in the same order as a serial run, and only the outputs are computed in the pool.
+        '''
         import dill as pickle
-        from cryptography.fernet import Fernet
-        fernet = Fernet(key)
-        with open(path, 'rb') as fin:
-            self.cases = pickle.loads(fernet.decrypt(fin.read()))
+        from ..utils import fork_executor
+        from .serializers import dumps
+        executor = None
+        if n_workers and n_workers > 1:
+            executor = fork_executor(n_workers, _init_case_worker, (self,))
+        if executor is None:
+            for case_idx in range(n_cases):
+                if self.independent_cases:
+                    yield dumps(self.make_case(case_idx, stream), serializer)
+                else:
+                    yield dumps(self.make_case(), serializer)
+            return
+        if self.independent_cases:
+            with executor:
+                yield from executor.map(_make_indexed_case, ((stream, case_idx, serializer) for case_idx in range(n_cases)))
+            return
+        def staged_inputs():
+            for _ in range(n_cases):
+                self.input_data = self.make_inputs()
+                yield pickle.dumps({attr: getattr(self, attr) for attr in self.input_state_attrs}), serializer
+        with executor:
+            yield from executor.map(_make_case_outputs, staged_inputs())
+
+    def read_cases(self, path, key=b'sIRWMgIhwENImJyOel3HWJDMr0VbXzfbq-uwgd09VFs='):
+        from .case_file import read_case_file
+        self.cases = read_case_file(path, key)
         return self.cases
         
     def make_inputs(self):
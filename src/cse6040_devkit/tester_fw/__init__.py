@@ -33,16 +33,59 @@ class ExerciseTester():
         '''
         Run the test. Call other methods to test a student solution.
         '''
-        self.build_vars()        # Build inputs and true outputs
+        self.last_phase_times = dict()
+        self._timed('build_vars', self.build_vars)         # Build inputs and true outputs
         if self.prevent_mod:
-            self.copy_vars()         # Create copy of inputs
+            self._timed('copy_vars', self.copy_vars)       # Create copy of inputs
         else:
             self.original_input_vars = self.input_vars
-        self.run_func(func)      # Run the function being tested and set the returned outputs
-        if self.prevent_mod:     #  - can disable by setting `prevent_mod`to `False` in constructor
-            self.check_modified()    # Check to verify inputs were not modified
-        self.check_type()        # Check to verify correct output types
-        self.check_matches()     # Check to verify correct output
+        self._timed('run_func', self.run_func, func)       # Run the function being tested and set the returned outputs
+        if self.prevent_mod:                               #  - can disable by setting `prevent_mod`to `False` in constructor
+            self._timed('check_modified', self.check_modified) # Check to verify inputs were not modified
+        self._timed('check_type', self.check_type)         # Check to verify correct output types
+        self._timed('check_matches', self.check_matches)   # Check to verify correct output
+
+    # Do not override this method
+    def _timed(self, phase, method, *args):
+        '''
+        Calls `method(*args)` and records its wall time under `phase`, even when it raises.
+        '''
+        from time import perf_counter
+        start = perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = perf_counter() - start
+            self.last_phase_times[phase] = elapsed
+            self.add_phase_times({phase: elapsed})
+
+    # Do not override this method
+    def add_phase_times(self, phase_times):
+        '''
+        Adds the times in `phase_times` (a dict mapping phase names to seconds) to the ones summarized by `get_phase_stats`. Used for runs made in other processes.
+        '''
+        # Subclasses don't always call this class's constructor, so the record is created on first use
+        recorded = self.__dict__.setdefault('phase_times', dict())
+        for phase, elapsed in phase_times.items():
+            recorded.setdefault(phase, []).append(elapsed)
+
+    # Do not override this method
+    def get_phase_stats(self):
+        '''
+        Summarizes the wall time of each phase of `run_test` over every run so far. Returns a dict mapping phase names to dicts with the `count`, `total`, `p50`, `p95` and `max` in seconds.
+        '''
+        from math import ceil
+        stats = dict()
+        for phase, times in self.__dict__.get('phase_times', dict()).items():
+            ordered = sorted(times)
+            n = len(ordered)
+            stats[phase] = {'count': n,
+                            'total': sum(ordered),
+                            # nearest-rank percentiles
+                            'p50': ordered[ceil(0.5 * n) - 1],
+                            'p95': ordered[ceil(0.95 * n) - 1],
+                            'max': ordered[-1]}
+        return stats
 
     
     # Do not override this method
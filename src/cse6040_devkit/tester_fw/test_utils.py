@@ -1,3 +1,10 @@
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import singledispatch
+from math import isinf
+import numpy as np
+import pandas as pd
+
 def canonicalize_tibble(X, remove_index=True):
     var_names = sorted(X.columns)
     Y = X[var_names].copy()
@@ -14,83 +21,466 @@ def assert_tibbles_left_matches_right(A, B, exact=False, sort_df=True, col_type=
                        check_column_type=False,
                        check_names=False)
 
+def assert_tibble_rows_match(A, B, tol=0, col_type=True, n_show=5):
+    """Checks that DataFrames `A` and `B` have the same columns and the same multiset of rows, ignoring row order, column order and the index.
+
+    Unlike `assert_tibbles_left_matches_right` this does not sort. Each row is hashed with `pandas.util.hash_pandas_object` and the hashes are counted, which takes linear time and works for columns holding values which can't be ordered.
+    Floats are hashed after rounding to multiples of `tol`. When the hashes of some rows don't occur equally often on both sides, all rows sharing their non-float values are sorted by their float values and compared in pairs, allowing an absolute difference of `tol`. That way values on either side of a rounding boundary still match.
+    The tolerance is absolute, unlike in `assert_tibbles_left_matches_right`, which leaves it to `assert_frame_equal` (relative 1e-5, absolute 1e-8). A `tol` of 1e-6 is therefore stricter than the sort based check for values above 0.1 and looser for values near zero.
+
+    Raises an AssertionError showing up to `n_show` of the first rows which could not be matched.
+    """
+    if A.shape[1] != B.shape[1] or set(A.columns) != set(B.columns):
+        raise AssertionError(f'DataFrame columns are different.\nleft: {list(A.columns)}\nright: {list(B.columns)}')
+    if A.shape[0] != B.shape[0]:
+        raise AssertionError(f'DataFrame shapes are different.\nleft: {A.shape}\nright: {B.shape}')
+    B = B[list(A.columns)]
+    if col_type and not A.dtypes.equals(B.dtypes):
+        raise AssertionError(f'DataFrame column dtypes are different.\nleft:\n{A.dtypes}\nright:\n{B.dtypes}')
+    float_cols = [i for i in range(A.shape[1])
+                  if _is_float_like(A.iloc[:, i], B.iloc[:, i], col_type)]
+    exact_cols = [i for i in range(A.shape[1]) if i not in float_cols]
+    a_groups, a_hashes = _row_hashes(A, exact_cols, float_cols, tol)
+    b_groups, b_hashes = _row_hashes(B, exact_cols, float_cols, tol)
+    unbalanced = _unbalanced_hashes(a_hashes, b_hashes)
+    if not len(unbalanced):
+        return
+    # Values on either side of a rounding boundary get different hashes. Every row in a group of equal non-float values
+    # holding such a row is sorted by its float values and compared in pairs instead.
+    recheck = np.union1d(a_groups[np.isin(a_hashes, unbalanced)], b_groups[np.isin(b_hashes, unbalanced)])
+    a_rest, a_keys = _sorted_rest(A, a_groups, np.flatnonzero(np.isin(a_groups, recheck)), float_cols)
+    b_rest, b_keys = _sorted_rest(B, b_groups, np.flatnonzero(np.isin(b_groups, recheck)), float_cols)
+    if len(a_rest) == len(b_rest):
+        matched = a_keys[0] == b_keys[0]
+        for a_vals, b_vals in zip(a_keys[1:], b_keys[1:]):
+            matched &= np.isclose(a_vals, b_vals, rtol=0, atol=tol, equal_nan=True)
+        if matched.all():
+            return
+        unmatched = np.flatnonzero(~matched)[:n_show]
+        a_show, b_show = a_rest[unmatched], b_rest[unmatched]
+    else:
+        a_show, b_show = a_rest[:n_show], b_rest[:n_show]
+    raise AssertionError(f'''DataFrame rows are different. These are the first rows that could not be matched.
+left:
+{A.iloc[a_show]}
+right:
+{B.iloc[b_show]}''')
+
+def _is_float_like(a_col, b_col, col_type):
+    from pandas.api.types import is_float_dtype, is_numeric_dtype, is_bool_dtype
+    if col_type:
+        return is_float_dtype(a_col)
+    # ints and floats compare equal, so hash both as floats
+    return all(is_numeric_dtype(c) and not is_bool_dtype(c) for c in (a_col, b_col)) \
+        and (is_float_dtype(a_col) or is_float_dtype(b_col))
+
+def _row_hashes(df, exact_cols, float_cols, tol):
+    # Returns a hash of the non-float values of each row and a hash of the whole row with floats rounded to multiples of `tol`
+    groups = np.zeros(df.shape[0], dtype='uint64')
+    if exact_cols:
+        exact = df.iloc[:, exact_cols].reset_index(drop=True)
+        try:
+            groups = pd.util.hash_pandas_object(exact, index=False).to_numpy()
+        except (TypeError, ValueError):
+            # unhashable values such as lists stored in cells
+            groups = pd.util.hash_pandas_object(exact.astype(str), index=False).to_numpy()
+    if not float_cols:
+        return groups, groups
+    buckets = {}
+    for i in float_cols:
+        vals = df.iloc[:, i].to_numpy(dtype='float64', na_value=np.nan)
+        if tol > 0:
+            vals = np.round(vals / tol)
+        # adding 0.0 turns -0.0 into 0.0, and NaNs are replaced so that every NaN hashes the same
+        vals = vals + 0.0
+        vals[np.isnan(vals)] = np.nan
+        buckets[i] = vals
+    bucket_hashes = pd.util.hash_pandas_object(pd.DataFrame(buckets), index=False).to_numpy()
+    return groups, groups ^ (bucket_hashes * np.uint64(0x9E3779B97F4A7C15))
+
+def _sorted_rest(df, groups, positions, float_cols):
+    # Sorts the rows at `positions` by their group hash, then by their float values.
+    # Returns the sorted positions and a list of arrays: the group hashes followed by each float column.
+    rest = df.iloc[positions]
+    floats = [rest.iloc[:, i].to_numpy(dtype='float64', na_value=np.nan) for i in float_cols]
+    order = np.lexsort([*reversed(floats), groups[positions]])
+    return positions[order], [groups[positions][order], *(vals[order] for vals in floats)]
+
+def _unbalanced_hashes(a_hashes, b_hashes):
+    # Hashes which occur a different number of times in `a_hashes` and `b_hashes`
+    codes, uniques = pd.factorize(np.concatenate([a_hashes, b_hashes]))
+    a_counts = np.bincount(codes[:len(a_hashes)], minlength=len(uniques))
+    b_counts = np.bincount(codes[len(a_hashes):], minlength=len(uniques))
+    return uniques[a_counts != b_counts]
+
 def assert_tibbles_are_equivalent(A, B, **kwargs):
     assert_tibbles_left_matches_right(A, B, **kwargs)
 
-def compare_copies(a, b, tol=0, exact=False, sort_df=True, col_type=True):
-    import pandas as pd
-    import numpy as np
-    kwargs = {
-        'tol':tol,
-        'exact':exact,
-        'sort_df': sort_df,
-        'col_type': col_type
-    }
-    try:
-        # list or tuple
-        if (isinstance(a, list) and isinstance(b, list))\
-            or (isinstance(a, tuple) and isinstance(b, tuple)):
-            if len(a) != len(b): return False
-            return all(compare_copies(ai, bi, **kwargs) for ai, bi in zip(a, b))
-        # set
-        elif isinstance(a, set) and isinstance(b, set):
-            if len(a) != len(b): return False
-            return not (a - b)
-        # dict
-        elif isinstance(a, dict) and isinstance(b, dict):
-            if set(a.keys()) != set(b.keys()): return False
-            return all(compare_copies(va, b[ka], **kwargs) for ka, va in a.items())
-        # DataFrame
-        elif isinstance(a, pd.DataFrame):
-            try:
-                assert_tibbles_left_matches_right(a, b, exact, sort_df, col_type)
-                return True
-            except AssertionError:
+CompareOptions = namedtuple('CompareOptions', ['tol', 'exact', 'sort_df', 'col_type', 'df_engine'])
+CompareOptions.__doc__ = '''Options passed to every comparator. See `compare_copies`.'''
+
+class CompareEach():
+    def __init__(self, pairs):
+        '''Returned by a comparator when `a` and `b` match if and only if every `(a_item, b_item)` pair in `pairs` matches.
+
+        The pairs are compared by `compare_copies` in order. This lets comparators for containers hand their items back instead of recursing, so deeply nested structures can't overflow the stack.
+        '''
+        self.pairs = pairs
+
+@singledispatch
+def _compare(a, b, options):
+    return a == b
+
+def _is_sparse(obj):
+    # Checked by module name so that scipy is optional and only imported once a sparse matrix turns up
+    return type(obj).__module__.startswith('scipy.sparse')
+
+def _comparator(a):
+    # Sparse matrices are checked before dispatching, since some formats (dok) subclass dict and would get the dict comparator
+    if _is_sparse(a):
+        return _compare_sparse
+    return _compare.dispatch(type(a))
+
+def register_comparator(cls, func=None):
+    '''Registers `func(a, b, options)` as the comparator `compare_copies` uses when `a` is an instance of `cls`. Can be used as a decorator.
+
+    The comparator is given the object being checked `a`, the expected object `b` and a `CompareOptions`. It returns whether they match, or a `CompareEach` of item pairs which must all match.
+    Comparators are chosen by the type of `a` with `functools.singledispatch`, so a comparator for a base class also applies to its subclasses.
+    '''
+    return _compare.register(cls, func)
+
+def compare_copies(a, b, tol=0, exact=False, sort_df=True, col_type=True, df_engine='sort'):
+    options = CompareOptions(tol, exact, sort_df, col_type, df_engine)
+    pending = [(a, b)]
+    while pending:
+        a, b = pending.pop()
+        try:
+            result = _comparator(a)(a, b, options)
+            if isinstance(result, CompareEach):
+                # reversed so that items are compared in order
+                pending.extend(reversed(list(result.pairs)))
+            elif not result:
                 return False
-        # Series
-        elif isinstance(a, pd.Series) \
-            and isinstance(b, pd.Series):
-            if sort_df:
-                a = a.sort_index()
-                b = b.sort_index()
-                a = a.sort_values()
-                b = b.sort_values()
-            try:
-                pd.testing.assert_series_equal(a, b,
-                                               check_index_type=False,
-                                               check_names=False,
-                                               )
-                return True
-            except Exception as e:
-                print(e)
+        except Exception as e:
+            print(e)
+            return False
+    return True
+
+# list or tuple
+@register_comparator(list)
+@register_comparator(tuple)
+def _compare_sequences(a, b, options):
+    if not isinstance(b, (list, tuple)) or isinstance(a, list) != isinstance(b, list):
+        return a == b
+    if len(a) != len(b): return False
+    if len(a) >= _MIN_VECTORIZED_LENGTH:
+        arrays = _numeric_arrays(a, b)
+        if arrays is not None:
+            return _compare_numeric_arrays(*arrays)
+    return CompareEach(zip(a, b))
+
+# Shorter sequences are compared item by item, which is faster than converting them to arrays
+_MIN_VECTORIZED_LENGTH = 16
+
+def _numeric_arrays(a, b):
+    # Returns `a` and `b` as arrays if both are rectangular nests of lists or tuples holding only ints, floats and bools
+    # and their lists and tuples line up. Otherwise returns None and the items are compared one at a time.
+    if not (_holds_only_numbers(a) and _holds_only_numbers(b)):
+        return None
+    try:
+        a_arr = np.array(a)
+        b_arr = np.array(b)
+    except (ValueError, OverflowError):
+        return None
+    if a_arr.dtype not in _NUMERIC_DTYPES or b_arr.dtype not in _NUMERIC_DTYPES or a_arr.shape != b_arr.shape:
+        return None
+    if not _containers_line_up(a, b, a_arr.ndim - 1):
+        return None
+    return a_arr, b_arr
+
+_NUMERIC_DTYPES = {np.dtype('int64'), np.dtype('float64'), np.dtype('bool')}
+_NUMBER_TYPES = (int, float, np.integer, np.floating, np.bool_)
+
+def _holds_only_numbers(seq):
+    # Checked before `np.array`, which would otherwise build an object array from a long list of DataFrames, strings, etc.
+    # Stops at the first item which is neither a number nor a list or tuple.
+    pending = [seq]
+    while pending:
+        for item in pending.pop():
+            if isinstance(item, (list, tuple)):
+                pending.append(item)
+            elif not isinstance(item, _NUMBER_TYPES):
                 return False
-        # ints and floats
-        elif isinstance(a, (int, np.int64, float)) \
-            and isinstance(b, (int, np.int64, float)):
-            try:
-                return np.isclose(a, b)
-            except:
-                raise
-        # string or boolean
-        elif isinstance(a, (str, bool,)) \
-            and isinstance(b, (str, bool,)):
-
-            return a == b
-        # Array
-        elif isinstance(a, (np.ndarray,)) \
-            and isinstance(b, (np.ndarray,)):
-            return np.allclose(a, b, atol=tol, rtol=0, equal_nan=True)
-        
-        # None
-        elif (a is None and b is None):
+    return True
+
+def _containers_line_up(a, b, depth):
+    if depth == 0:
+        return True
+    return all(isinstance(ai, (list, tuple)) and isinstance(bi, (list, tuple))
+               and isinstance(ai, list) == isinstance(bi, list)
+               and _containers_line_up(ai, bi, depth - 1)
+               for ai, bi in zip(a, b))
+
+def _compare_numeric_arrays(a_arr, b_arr):
+    # Same test as comparing each pair of numbers on its own
+    close = np.isclose(a_arr.astype('float64'), b_arr.astype('float64'))
+    if close.all():
+        return True
+    idx = np.unravel_index(np.argmin(close), close.shape)
+    idx = idx[0] if len(idx) == 1 else tuple(int(i) for i in idx)
+    print(f'First mismatch at index {idx}: {a_arr[idx]} != {b_arr[idx]}')
+    return False
+
+@register_comparator(set)
+def _compare_sets(a, b, options):
+    if not isinstance(b, set):
+        return a == b
+    if len(a) != len(b): return False
+    return not (a - b)
+
+@register_comparator(dict)
+def _compare_dicts(a, b, options):
+    if not isinstance(b, dict):
+        return a == b
+    if set(a.keys()) != set(b.keys()): return False
+    return CompareEach((va, b[ka]) for ka, va in a.items())
+
+@register_comparator(pd.DataFrame)
+def _compare_frames(a, b, options):
+    if isinstance(b, SQLResult):
+        # expected results saved from `sql_executor(..., compare_in_db=True)`
+        b = b.to_frame()
+    if options.sort_df and options.df_engine == 'hash':
+        try:
+            assert_tibble_rows_match(a, b, 0 if options.exact else options.tol, options.col_type)
             return True
-        
-        else:
-            return a == b
+        except AssertionError as e:
+            print(e)
+            return False
+    try:
+        assert_tibbles_left_matches_right(a, b, options.exact, options.sort_df, options.col_type)
+        return True
+    except AssertionError:
+        return False
+
+@register_comparator(pd.Series)
+def _compare_series(a, b, options):
+    if not isinstance(b, pd.Series):
+        return a == b
+    if options.sort_df:
+        a = a.sort_index()
+        b = b.sort_index()
+        a = a.sort_values()
+        b = b.sort_values()
+    try:
+        pd.testing.assert_series_equal(a, b,
+                                       check_index_type=False,
+                                       check_names=False,
+                                       )
+        return True
     except Exception as e:
         print(e)
         return False
 
+# ints and floats
+@register_comparator(int)
+@register_comparator(np.int64)
+@register_comparator(float)
+def _compare_numbers(a, b, options):
+    if not isinstance(b, (int, np.int64, float)):
+        return a == b
+    # Same test as `np.isclose(a, b)` with its default tolerances, without the overhead of a NumPy call
+    try:
+        a, b = float(a), float(b)
+    except OverflowError:
+        return np.isclose(a, b)
+    if a == b: return True
+    if isinf(a) or isinf(b): return False
+    return abs(a - b) <= 1e-08 + 1e-05 * abs(b)
+
+@register_comparator(np.ndarray)
+def _compare_arrays(a, b, options):
+    if not isinstance(b, np.ndarray):
+        return a == b
+    return np.allclose(a, b, atol=options.tol, rtol=0, equal_nan=True)
+
+def _compare_sparse(a, b, options):
+    # Compares scipy.sparse matrices and arrays of any format without making them dense. Memory use is proportional to nnz.
+    from scipy.sparse import issparse
+    if not issparse(b) or a.shape != b.shape:
+        return False
+    a = _canonical_csr(a)
+    b = _canonical_csr(b)
+    if np.array_equal(a.indptr, b.indptr) and np.array_equal(a.indices, b.indices):
+        return np.allclose(a.data, b.data, atol=options.tol, rtol=0, equal_nan=True)
+    # The stored entries differ, e.g. where one side holds a tiny value and the other nothing
+    diff = abs(a - b)
+    return diff.nnz == 0 or diff.max() <= options.tol
+
+def _canonical_csr(m):
+    # CSR copy with duplicates summed, indices sorted and explicit zeros removed
+    m = m.tocsr(copy=True)
+    m.sum_duplicates()
+    m.eliminate_zeros()
+    return m
+
+def _strip_sql_terminator(query):
+    # Removes the `;` ending a query, which is not allowed in a subquery, even when comments follow it
+    end = None
+    i = 0
+    while i < len(query):
+        if query.startswith('--', i):
+            i = query.find('\n', i)
+            i = len(query) if i < 0 else i
+        elif query.startswith('/*', i):
+            i = query.find('*/', i + 2)
+            i = len(query) if i < 0 else i + 2
+        elif query[i] in '\'"`[':
+            # A doubled quote inside a string is read as two strings, which ends in the same place
+            close = query.find(']' if query[i] == '[' else query[i], i + 1)
+            end = len(query) - 1 if close < 0 else close
+            i = end + 1
+        else:
+            if not query[i].isspace():
+                end = i
+            i += 1
+    if end is not None and query[end] == ';':
+        return _strip_sql_terminator(query[:end] + query[end + 1:])
+    return query
+
+class SQLResult():
+    def __init__(self, conn=None, query=None, columns=None, rows=None):
+        '''Result of a SQL query which `compare_copies` can check against an expected result inside the database, without building DataFrames.
+
+        Returned by `plugins.sql_executor(..., compare_in_db=True)`. While bound to a connection the rows are only read when needed. Pickling stores the column names and rows, so expected results in case files are plain data.
+
+        Args:
+            conn (sqlite3.Connection): Connection the query runs against. None for a result which has already been read.
+            query (str): The query.
+            columns (list[str]): Names of the result columns.
+            rows (list[tuple]): The rows of a result which has already been read.
+        '''
+        self.conn = conn
+        self.query = query
+        self.columns = list(columns or [])
+        self._rows = rows
+
+    @classmethod
+    def from_query(cls, conn, query):
+        '''Binds `query` to `conn`. The query is prepared once so that errors in it are raised here.'''
+        query = _strip_sql_terminator(query.strip())
+        # LIMIT 0 gets the column names without running the whole query. The query goes on lines of its own so that a
+        # trailing `-- comment` doesn't comment out the closing parenthesis.
+        cursor = conn.execute(f'SELECT * FROM (\n{query}\n) LIMIT 0')
+        columns = [d[0] for d in cursor.description or []]
+        cursor.close()
+        return cls(conn, query, columns)
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = self.conn.execute(self.query).fetchall()
+        return self._rows
+
+    def to_frame(self):
+        return pd.DataFrame.from_records(self.rows, columns=self.columns)
+
+    def __reduce__(self):
+        return (SQLResult, (None, None, self.columns, self.rows))
+
+    def __repr__(self):
+        return repr(self.to_frame())
+
+    def _repr_html_(self):
+        return self.to_frame()._repr_html_()
+
+@register_comparator(SQLResult)
+def _compare_sql_results(a, b, options):
+    if isinstance(b, pd.DataFrame):
+        return _compare_frames(a.to_frame(), b, options)
+    if not isinstance(b, SQLResult):
+        return False
+    if sorted(a.columns) != sorted(b.columns):
+        print(f'The result has columns {a.columns} but {b.columns} were expected.')
+        return False
+    if a.conn is None:
+        return _compare_frames(a.to_frame(), b.to_frame(), options)
+    # position of each returned column in the expected rows
+    order = [b.columns.index(c) for c in a.columns]
+    if not options.sort_df:
+        return _compare_sql_ordered(a, b.rows, order, options)
+    return _compare_sql_in_db(a, b, order, options)
+
+def _compare_sql_ordered(a, expected_rows, order, options):
+    # Streams the returned rows from a cursor and compares them to the expected rows one at a time
+    from itertools import zip_longest
+    tol = 0 if options.exact else options.tol
+    cursor = a.conn.execute(a.query)
+    try:
+        for i, (a_row, b_row) in enumerate(zip_longest(cursor, expected_rows)):
+            if a_row is None or b_row is None:
+                print(f'The result has {"fewer" if a_row is None else "more"} rows than expected.')
+                return False
+            b_row = tuple(b_row[j] for j in order)
+            if not all(_same_sql_value(x, y, tol, options.col_type) for x, y in zip(a_row, b_row)):
+                print(f'First mismatch at row {i}: {a_row} != {b_row}')
+                return False
+        return True
+    finally:
+        cursor.close()
+
+def _same_sql_value(x, y, tol, col_type):
+    if col_type and type(x) is not type(y):
+        return False
+    if isinstance(x, (int, float)) and isinstance(y, (int, float)):
+        return x == y or abs(x - y) <= tol
+    return x == y
+
+def _compare_sql_in_db(a, b, order, options, n_show=5):
+    # Loads the expected rows into a temporary table next to the data the query ran on. Every row of both results is
+    # counted in one GROUP BY, +1 for returned and -1 for expected. The results match when no group is left with a
+    # nonzero count, which is the same as both directions of EXCEPT ALL being empty.
+    from math import floor, log10
+    from uuid import uuid4
+    n_cols = len(order)
+    names = [f'c{i}' for i in range(n_cols)]
+    # returned columns are named after their position in the expected rows, so neither side has to be reordered
+    returned_names = [names[j] for j in order]
+    table = f'_expected_{uuid4().hex}'
+    tol = 0 if options.exact else options.tol
+    digits = max(0, -floor(log10(tol))) if tol > 0 else None
+    conn = a.conn
+    conn.execute(f'CREATE TEMP TABLE {table} ({", ".join(names)})')
+    try:
+        conn.executemany(f'INSERT INTO {table} VALUES ({", ".join("?" * n_cols)})', b.rows)
+        # Floats are compared after rounding to the decimal place of the tolerance
+        has_floats = conn.execute(f'''SELECT {", ".join(f"MAX(typeof({name}) = 'real')" for name in names)} FROM {table}''').fetchone()
+        keys = [f'ROUND({name}, {digits})' if (has_floats[i] and digits is not None) else name
+                for i, name in enumerate(names)]
+        if options.col_type:
+            keys += [f'typeof({name})' for name in names]
+        keys = ', '.join(keys)
+        unmatched = conn.execute(f'''WITH _returned({', '.join(returned_names)}) AS (
+{a.query}
+)
+SELECT {keys}, SUM(side) FROM (
+    SELECT {', '.join(names)}, 1 AS side FROM _returned
+    UNION ALL
+    SELECT {', '.join(names)}, -1 AS side FROM {table})
+GROUP BY {keys}
+HAVING SUM(side) != 0
+LIMIT {n_show}''').fetchall()
+    finally:
+        conn.execute(f'DROP TABLE temp.{table}')
+    if unmatched and digits is not None and any(has_floats):
+        # Values within the tolerance can still round to different buckets, so the verdict has to come from pandas
+        return _compare_frames(a.to_frame(), b.to_frame(), options)
+    if unmatched:
+        print(f'''The rows of the result do not match the expected rows. Each line below is a row with the values of {tuple(b.columns)}{" followed by their SQLite types" if options.col_type else ""}, and then how many more times it was returned than expected (negative when it was expected more often).
+{chr(10).join(map(str, unmatched))}''')
+        return False
+    return True
+
 
     
 
@@ -119,6 +509,170 @@ def dfs_to_conn(conn_dfs, index=False):
         df.to_sql(table_name, conn, if_exists='replace', index=index)
     return conn
 
+def clone_conn(conn):
+    """Copies a SQLite database into a new in-memory connection using the backup API. This is much faster than rebuilding the tables from DataFrames."""
+    import sqlite3
+    clone = sqlite3.connect(':memory:')
+    conn.backup(clone)
+    return clone
+
+_PLAIN_TYPES = {int, float, bool, str, bytes, type(None)}
+
+def fingerprint(obj):
+    """Returns a digest of the contents of `obj`. Comparing digests taken before and after a function call detects changes to `obj` without keeping a copy of it.
+
+    NumPy arrays are hashed from their raw buffers and pandas objects with `pandas.util.hash_pandas_object`. Containers are hashed item by item (ignoring order for dicts and sets, as `==` does). Anything else is hashed from its pickled bytes.
+    """
+    import hashlib
+    digest = hashlib.blake2b(digest_size=16)
+    _update_fingerprint(digest, obj)
+    return digest.digest()
+
+def _update_fingerprint(digest, obj):
+    import pickle
+    digest.update(type(obj).__qualname__.encode())
+    if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+        digest.update(f'{obj.dtype.str}{obj.shape}'.encode())
+        digest.update(np.ascontiguousarray(obj).data)
+    elif isinstance(obj, (pd.DataFrame, pd.Series)):
+        columns = obj.columns if isinstance(obj, pd.DataFrame) else [obj.name]
+        dtypes = obj.dtypes if isinstance(obj, pd.DataFrame) else [obj.dtype]
+        digest.update(pickle.dumps((list(columns), [str(d) for d in dtypes], list(obj.index.names), str(obj.index.dtype))))
+        try:
+            digest.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+        except (TypeError, ValueError):
+            # unhashable values such as lists stored in cells
+            digest.update(pickle.dumps(obj, protocol=4))
+    elif isinstance(obj, (list, tuple)):
+        if all(type(item) in _PLAIN_TYPES for item in obj):
+            digest.update(pickle.dumps(obj, protocol=4))
+            return
+        digest.update(str(len(obj)).encode())
+        for item in obj:
+            _update_fingerprint(digest, item)
+    elif isinstance(obj, dict):
+        digest.update(b''.join(sorted(fingerprint(k) + fingerprint(v) for k, v in obj.items())))
+    elif isinstance(obj, (set, frozenset)):
+        digest.update(b''.join(sorted(fingerprint(item) for item in obj)))
+    else:
+        try:
+            digest.update(pickle.dumps(obj, protocol=4))
+        except Exception:
+            import dill
+            digest.update(dill.dumps(obj))
+
+def readonly_view(obj):
+    """Returns a view of `obj` which cannot be used to change `obj`, or None if `obj` is not supported.
+
+    - NumPy arrays get a view with `writeable=False`. Writing to it raises a `ValueError`.
+    - pandas objects get a shallow copy when copy-on-write is enabled. Changes to the copy never reach `obj`. Use `shallow_copy_unchanged` to find out whether the copy was changed.
+    """
+    if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+        view = obj.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(obj, (pd.DataFrame, pd.Series)) and _copy_on_write_enabled():
+        return obj.copy(deep=False)
+    return None
+
+def _copy_on_write_enabled():
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return True
+    return getattr(pd.options.mode, 'copy_on_write', False) is True
+
+def shallow_copy_unchanged(view, original):
+    """Checks a shallow copy made by `readonly_view` against the object it was made from without comparing every value.
+
+    Under copy-on-write any change to the values of `view` copies them first, so a NumPy backed column that still shares memory with `original` is unchanged. Empty columns have no memory to share and are unchanged once the index and dtypes match. Columns with other dtypes are compared with `equals`.
+    """
+    if isinstance(original, pd.Series):
+        if not isinstance(view, pd.Series) or view.name != original.name:
+            return False
+        view, original = view.to_frame(), original.to_frame()
+    if not (view.columns.equals(original.columns)
+            and view.index.equals(original.index)
+            and view.dtypes.equals(original.dtypes)):
+        return False
+    for i in range(original.shape[1]):
+        view_col, original_col = view.iloc[:, i], original.iloc[:, i]
+        if isinstance(original_col.dtype, np.dtype) and not original_col.dtype.hasobject:
+            if original_col.size and not np.shares_memory(view_col.to_numpy(), original_col.to_numpy()):
+                return False
+        elif not view_col.equals(original_col):
+            return False
+    return True
+
+class CaseTimeout(BaseException):
+    # Derived from BaseException so that `except Exception` in a solution doesn't swallow it
+    def __init__(self, message, limit=None):
+        super().__init__(message)
+        # The value yielded by the `resource_limits` block whose timer ran out
+        self.limit = limit
+
+def _address_space_size():
+    import os
+    # The first field of statm is the size of the address space in pages
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+
+@contextmanager
+def resource_limits(timeout=None, memory_mb=None):
+    '''Limits the wall-clock time and memory of the code run in the `with` block.
+
+    Time is limited with a `SIGALRM` interval timer, which raises `CaseTimeout` in the block. The block gets a token which is the `limit` of the `CaseTimeout` raised for its own timeout, so a timeout of an enclosing block can be told apart and passed on. Python code is interrupted right away, and calls into compiled code are interrupted when they return. Memory is limited by lowering `RLIMIT_AS` to the current address space size plus `memory_mb`, unless it is already lower, so allocations past the limit raise `MemoryError`. Both limits are lifted when the block exits. Limits which the platform can't enforce are skipped with a warning.
+
+    Args:
+        timeout (float, optional): Seconds the block may run. Defaults to None, which sets no limit.
+        memory_mb (float, optional): Megabytes the block may allocate. Defaults to None, which sets no limit.
+    '''
+    import signal
+    import threading
+    from warnings import warn
+    restore = []
+    token = object()
+    try:
+        if timeout:
+            if hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread():
+                from time import monotonic
+                # An enclosing limit keeps running. Whichever deadline comes first fires, and the enclosing one is re-armed on exit.
+                outer_delay = signal.getitimer(signal.ITIMER_REAL)[0]
+                started = monotonic()
+                def on_alarm(signum, frame):
+                    if outer_delay and monotonic() - started >= outer_delay and callable(previous_handler):
+                        previous_handler(signum, frame)
+                    raise CaseTimeout(f'The call did not finish within {timeout} seconds.', token)
+                def rearm_outer():
+                    if outer_delay:
+                        signal.setitimer(signal.ITIMER_REAL, max(outer_delay - (monotonic() - started), 1e-6))
+                    else:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+                previous_handler = signal.signal(signal.SIGALRM, on_alarm)
+                restore.append(lambda: signal.signal(signal.SIGALRM, previous_handler))
+                signal.setitimer(signal.ITIMER_REAL, min(timeout, outer_delay) if outer_delay else timeout)
+                restore.append(rearm_outer)
+            else:
+                warn('A timeout can only be set from the main thread of a Unix process. Running without one.')
+        if memory_mb:
+            try:
+                import resource
+                address_space = _address_space_size()
+            except (ImportError, OSError):
+                warn('Memory limits need the resource module and /proc. Running without one.')
+            else:
+                soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+                limit = address_space + int(memory_mb * 2**20)
+                # Only ever tightens the limit, so a stricter one set by the operator or an enclosing block still holds
+                if soft != resource.RLIM_INFINITY:
+                    limit = min(limit, soft)
+                if hard != resource.RLIM_INFINITY:
+                    limit = min(limit, hard)
+                resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+                restore.append(lambda: resource.setrlimit(resource.RLIMIT_AS, (soft, hard)))
+        yield token
+    finally:
+        for undo in reversed(restore):
+            undo()
+
 def get_memory_usage():
     import os
     import psutil
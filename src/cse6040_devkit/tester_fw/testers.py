@@ -1,34 +1,88 @@
+from collections import OrderedDict
 from . import ExerciseTester
 
+# Indices of the cases which have passed in this process, keyed by `CaseFile.identity`
+_passed_cases = dict()
+
+# SQLite databases of cases which have run more than once in this process, keyed by
+# `(CaseFile.identity, case index, input key)` in least recently used order. The oldest are closed beyond `MAX_DB_TEMPLATES`.
+_db_templates = OrderedDict()
+_db_cases_seen = set()
+MAX_DB_TEMPLATES = 8
+
 class Tester(ExerciseTester):
-    def __init__(self, conf, key, path):
-        import dill as pickle
-        from cryptography.fernet import Fernet
-        from random import shuffle
-        fernet = Fernet(key)
-        with open(f"{path}{conf['case_file']}", 'rb') as fin:
-            self.cases = pickle.loads(fernet.decrypt(fin.read()))
-        shuffle(self.cases)
-        self.cases_iter = (case for case in self.cases)
+    def __init__(self, conf, key, path, seed=None):
+        from ..test_case.shared_store import SharedCaseStore, open_cases
+        from random import Random, shuffle
+        # Only the order is shuffled up front. Each case is decrypted when `build_vars` needs it.
+        self.cases = open_cases(f"{path}{conf['case_file']}", key)
+        self.shared_cases = isinstance(self.cases, SharedCaseStore)
+        self.pristine_inputs = dict()
+        self.case_order = list(range(len(self.cases)))
+        if seed is None:
+            shuffle(self.case_order)
+        else:
+            Random(seed).shuffle(self.case_order)
+        self.case_position = 0
+        self.case_index = None
         self.func = conf['func']
         self.conf_inputs = conf['inputs']
         self.conf_outputs = conf['outputs']
+        self.limits = conf.get('limits') or dict()
         self.prevent_mod = True
         self.input_vars = dict()
         self.original_input_vars = dict()
+        self.input_fingerprints = dict()
+        self.readonly_inputs = set()
         self.returned_output_vars = dict()
         self.true_output_vars = dict()
     
     def copy_vars(self):
         from copy import deepcopy
-        self.original_input_vars = {k: deepcopy(v) 
-                                        for k, v in self.input_vars.items()
-                                        if self.conf_inputs[k]['check_modified']}   
+        from .test_utils import fingerprint, readonly_view
+        self.original_input_vars = dict()
+        self.input_fingerprints = dict()
+        self.readonly_inputs = set()
+        for k, v in self.input_vars.items():
+            mode = self.conf_inputs[k]['check_modified']
+            if not mode: continue
+            if k in self.pristine_inputs:
+                # Shared cases can't be changed, so the case itself is the original
+                self.original_input_vars[k] = self.pristine_inputs[k]
+                continue
+            if mode == 'readonly':
+                # The solution gets a protected view and the original is kept without copying.
+                # Inputs with no read-only view fall back to a copy.
+                view = readonly_view(v)
+                if view is not None:
+                    self.original_input_vars[k] = v
+                    self.input_vars[k] = view
+                    self.readonly_inputs.add(k)
+                    continue
+            if mode == 'fingerprint':
+                # keep a digest of the input instead of a copy
+                self.input_fingerprints[k] = fingerprint(v)
+            else:
+                self.original_input_vars[k] = deepcopy(v)
     
     def check_modified(self):
+        import pandas as pd
+        from .test_utils import fingerprint, shallow_copy_unchanged
+        for var_name, digest in self.input_fingerprints.items():
+            if fingerprint(self.input_vars[var_name]) != digest:
+                # Decode the case again to get unmodified originals for debugging. The cases of a legacy file are
+                # decoded once, so indexing would return the objects the solution just modified.
+                case = self.cases.load_fresh(self.case_index)
+                self.original_input_vars.update({k: case[k] for k in self.input_fingerprints})
+                assert False, f'Your solution modified the input variable `{var_name}`. You can use the testing variables for debugging.'
+        for var_name in self.readonly_inputs:
+            original = self.original_input_vars[var_name]
+            # NumPy views can't be written to, so only pandas copies need checking
+            if isinstance(original, (pd.DataFrame, pd.Series)):
+                assert shallow_copy_unchanged(self.input_vars[var_name], original), f'Your solution modified the input variable `{var_name}`. You can use the testing variables for debugging.'
         for var_name in self.original_input_vars:
             if not self.conf_inputs[var_name]['check_modified']: continue
-            import pandas as pd
+            if var_name in self.readonly_inputs: continue
             import numpy as np
             if isinstance(self.original_input_vars[var_name], pd.Series):
                 try:
@@ -47,27 +101,83 @@ class Tester(ExerciseTester):
                 assert condition, f'Your solution modified the input variable `{var_name}`. You can use the testing variables for debugging.'
     
     def run_test(self, func=None):
-        return super().run_test(self.func)
+        super().run_test(self.func)
+        self.mark_passed(self.case_index)
+
+    def mark_passed(self, case_index):
+        '''Records that case `case_index` passed in this process.'''
+        _passed_cases.setdefault(self.cases.identity, set()).add(case_index)
+
+    def prioritize_unpassed(self):
+        '''Moves the cases which have not passed yet in this process to the front of the run order. Both groups keep their shuffled order.'''
+        passed = _passed_cases.get(self.cases.identity, set())
+        self.case_order.sort(key=lambda idx: idx in passed)
+
+    def n_passed(self):
+        '''Number of distinct cases in this case file which have passed in this process.'''
+        return len(_passed_cases.get(self.cases.identity, ()))
+
+    def get_db(self, input_key, conn_data):
+        '''Returns a fresh connection to the database for `input_key` in the current case.
+
+        `conn_data` is either a dict mapping table names to DataFrames or the bytes of a serialized SQLite database. The first run of a case in this process gets a database loaded from it. When the case runs again, the loaded database is kept as a template and later runs get a copy of it. Up to `MAX_DB_TEMPLATES` templates are kept.
+        '''
+        from .test_utils import dfs_to_conn, clone_conn
+        from ..test_case.input_gen_utils import bytes_to_conn
+        template_key = (self.cases.identity, self.case_index, input_key)
+        if template_key in _db_templates:
+            _db_templates.move_to_end(template_key)
+            return clone_conn(_db_templates[template_key])
+        conn = bytes_to_conn(conn_data) if isinstance(conn_data, bytes) else dfs_to_conn(conn_data)
+        if template_key not in _db_cases_seen:
+            _db_cases_seen.add(template_key)
+            return conn
+        _db_templates[template_key] = conn
+        while len(_db_templates) > MAX_DB_TEMPLATES:
+            _db_templates.popitem(last=False)[1].close()
+        return clone_conn(conn)
 
     def build_vars(self):
-        from .test_utils import dfs_to_conn
-        from random import choice
-        try:
-            case = next(self.cases_iter)
-        except StopIteration:
-            self.cases_iter = (case for case in self.cases)
-            case = next(self.cases_iter)
+        self.case_index = self.case_order[self.case_position % len(self.case_order)]
+        self.case_position += 1
+        case = self.cases[self.case_index]
+        self.pristine_inputs = dict()
         for input_key, input_dict in self.conf_inputs.items():
             if input_dict['dtype'] == 'db':
-                temp_conn = dfs_to_conn(case[input_key])
+                temp_conn = self.get_db(input_key, case[input_key])
                 self.input_vars[input_key] = temp_conn
+            elif self.shared_cases and input_dict['check_modified'] != 'readonly':
+                # Arrays from a shared store are read-only, so the solution gets its own copy
+                from copy import deepcopy
+                self.pristine_inputs[input_key] = case[input_key]
+                self.input_vars[input_key] = deepcopy(case[input_key])
             else:
                 self.input_vars[input_key] = case[input_key]
         for output_key in self.conf_outputs:
             self.true_output_vars[output_key] = case[output_key]
 
     def run_func(self, func):
-        out = func(**self.input_vars)
+        from .test_utils import resource_limits, CaseTimeout
+        timeout = self.limits.get('timeout')
+        memory_mb = self.limits.get('memory_mb')
+        limit = None
+        try:
+            with resource_limits(timeout, memory_mb) as limit:
+                out = func(**self.input_vars)
+        except CaseTimeout as e:
+            # A timeout of an enclosing limit, such as the one for a whole submission, is not this case's to report
+            if e.limit is not limit:
+                raise
+            raise AssertionError(f'Your solution did not finish within the {timeout} second limit for this test case. The inputs are available as `input_vars` for debugging.') from e
+        except MemoryError as e:
+            if not memory_mb: raise
+            raise AssertionError(f'Your solution used more than the {memory_mb} MB of memory allowed for this test case. The inputs are available as `input_vars` for debugging.') from e
+        except ValueError as e:
+            # NumPy raises e.g. "assignment destination is read-only" when a read-only input is written to
+            if self.readonly_inputs and 'read-only' in str(e):
+                names = ', '.join(f'`{k}`' for k in sorted(self.readonly_inputs))
+                raise AssertionError(f'Your solution attempted to modify one of the input variables {names}, which are read-only in this test. Make a copy (e.g. with `.copy()`) before changing an input.') from e
+            raise
         if not isinstance(out, tuple):
             out = (out,)
         out_keys = sorted(self.conf_outputs, key=lambda x: self.conf_outputs[x]['index'])
@@ -83,6 +193,12 @@ class Tester(ExerciseTester):
             'array': (np.ndarray,)
         }
         for out_key, out_dict in self.conf_outputs.items():
+            if out_dict['dtype'] == 'sparse':
+                # scipy is optional, so sparse types are only checked when asked for
+                from scipy.sparse import issparse
+                o = self.returned_output_vars[out_key]
+                assert issparse(o), f'A scipy.sparse matrix or array is required for {out_key} but {str(type(o))} was returned.'
+                continue
             t = type_options.get(out_dict['dtype'])
             if (t is None) or (t == ''): continue
             o = self.returned_output_vars[out_key]
@@ -96,7 +212,8 @@ class Tester(ExerciseTester):
                                             b=self.true_output_vars[out_key],
                                             tol=out_dict['float_tolerance'],
                                             sort_df=not out_dict['check_row_order'],
-                                            col_type=out_dict['check_col_dtypes']), \
+                                            col_type=out_dict['check_col_dtypes'],
+                                            df_engine=out_dict.get('df_compare', 'sort')), \
             f'''
 Output for {out_key} is incorrect.
 The returned result is available as `returned_output_vars['{out_key}']`
@@ -104,16 +221,76 @@ The expected result is available as `true_output_vars['{out_key}']`
             '''
 
 
+# Parsed files keyed by (path, kind). Each entry is (size, mtime_ns) of the file when it was read and the loaded value.
+_config_cache = dict()
+
+def _cached_load(path, kind, loader, mode='r'):
+    import os
+    stat = os.stat(path)
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    cached = _config_cache.get((path, kind))
+    if cached is None or cached[0] != stamp:
+        with open(path, mode) as f:
+            cached = (stamp, loader(f))
+        _config_cache[(path, kind)] = cached
+    return cached[1]
+
+def _config_digest(f):
+    import hashlib
+    return hashlib.sha256(f.read()).hexdigest()
+
+def exercise_config_path(conf_path, ex_name):
+    '''Path of the JSON sidecar holding the test configuration of `ex_name`, next to the config file at `conf_path`.'''
+    import os
+    return os.path.join(os.path.dirname(os.path.realpath(conf_path)), f'{ex_name}_config.json')
+
+def write_exercise_configs(conf_path, exercises):
+    '''Writes a JSON sidecar for the test configuration of each exercise in `exercises`.
+
+    Each sidecar records a digest of the config file contents, so it is only used while the config file is unchanged. The digest still matches after the files are copied elsewhere.
+
+    Args:
+        conf_path (str): Path of the config file the sidecars are made from. It must already be written.
+        exercises (dict): Maps exercise names to their entries in the config file.
+    '''
+    import json
+    with open(conf_path, 'rb') as f:
+        digest = _config_digest(f)
+    for ex_name, ex in exercises.items():
+        if not ex.get('config'):
+            continue
+        with open(exercise_config_path(conf_path, ex_name), 'w') as f:
+            json.dump({'source': digest, 'config': ex['config']}, f)
+
+def load_exercise_config(conf_path, ex_name):
+    '''Returns a copy of the test configuration of `ex_name`.
+
+    Parsed files are cached for the life of the process and re-read when their size or modification time changes. The exercise's JSON sidecar is used when it was made from the current config file, so YAML is only parsed when it is missing or out of date.
+
+    Args:
+        conf_path (str): Path of the assignment config file.
+        ex_name (str): Name of the exercise.
+    '''
+    import json
+    import os
+    from copy import deepcopy
+    from yaml import safe_load
+    conf_path = os.path.realpath(conf_path)
+    sidecar = exercise_config_path(conf_path, ex_name)
+    if os.path.exists(sidecar):
+        data = _cached_load(sidecar, 'json', json.load)
+        if data.get('source') == _cached_load(conf_path, 'digest', _config_digest, 'rb'):
+            return deepcopy(data['config'])
+    return deepcopy(_cached_load(conf_path, 'yaml', safe_load)['exercises'][ex_name]['config'])
+
 def get_tester(func,
                   ex_name,
                   key,
                   hidden=False,
                   conf_path='resource/asnlib/publicdata/assignment_config.yaml',
                   path = 'resource/asnlib/publicdata/'):
-    from yaml import safe_load
     if hidden: path += 'encrypted/'
-    with open(conf_path) as f:
-        ex_conf = safe_load(f)['exercises'][ex_name]['config']
+    ex_conf = load_exercise_config(conf_path, ex_name)
     ex_conf['func'] = func
     tester = Tester(ex_conf, key, path)
     return tester
\ No newline at end of file
@@ -2,14 +2,19 @@ import dill
 from collections import namedtuple
 
 def load_object_from_publicdata(name):
+    from cse6040_devkit.test_case.serializers import read_object
     with open(f'resource/asnlib/publicdata/{name}', 'rb') as f:
-        obj = dill.load(f)
+        obj = read_object(f)
     print(f'Successfully loaded {name}.')
     return obj
 
-def dump_object_to_publicdata(obj, name):
+def dump_object_to_publicdata(obj, name, serializer='dill'):
     with open(f'resource/asnlib/publicdata/{name}', 'wb') as f:
-        dill.dump(obj, f, recurse=True)
+        if serializer == 'dill':
+            dill.dump(obj, f, recurse=True)
+        else:
+            from cse6040_devkit.test_case.serializers import write_object
+            write_object(f, obj, serializer)
 
 def add_from_file(name, m):
     print(m.__name__)
@@ -22,14 +27,8 @@ def compare_test_cases(name, other_name, keys,
                        return_obj=False, 
                        path='resource/asnlib/publicdata/',
                        other_path='resource/asnlib/publicdata/'):
-    import dill as pickle
-    from cryptography.fernet import Fernet
     from cse6040_devkit.tester_fw.test_utils import compare_copies
-    def read_file(fn, key):
-        fernet = Fernet(key)
-        with open(fn, 'rb') as fin:
-            obj = pickle.loads(fernet.decrypt(fin.read()))
-        return obj
+    from cse6040_devkit.test_case.case_file import read_case_file as read_file
     enc_path = path + 'encrypted/'
     other_enc_path = other_path + 'encrypted/'
     obj = read_file(path + name, keys['visible_key'])
@@ -42,6 +41,30 @@ def compare_test_cases(name, other_name, keys,
         return visible_same, hidden_same, obj, old_obj, hobj, hold_obj
     return visible_same, hidden_same
 
+def fork_executor(n_workers, initializer=None, initargs=()):
+    """Creates a process pool whose workers are forked from the current process.
+
+    Forked workers inherit the parent's memory, so `initargs` (and anything reachable from them) are available in the workers without being pickled. This is what allows solution functions and samplers which only `dill` can serialize to be used in a worker pool.
+
+    Args:
+        n_workers (int): Number of worker processes.
+        initializer (function, optional): Called once in each worker with `*initargs` when the worker starts. Defaults to None.
+        initargs (tuple, optional): Arguments for `initializer`. Defaults to ().
+
+    Returns:
+        ProcessPoolExecutor|None: The pool or None if the platform does not support forking. Callers should fall back to serial execution when None is returned.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from warnings import warn
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        warn('The fork start method is not available on this platform. Running serially.')
+        return None
+    return ProcessPoolExecutor(n_workers,
+                               mp_context=multiprocessing.get_context('fork'),
+                               initializer=initializer,
+                               initargs=initargs)
+
 def is_hashable(variable):
     """
     Args:
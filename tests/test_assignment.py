@@ -0,0 +1,59 @@
+import json
+import random
+import pytest
+from cryptography.fernet import Fernet
+from cse6040_devkit.assignment import execute_tests
+from cse6040_devkit.test_case.case_file import CaseFileWriter
+from cse6040_devkit.test_case.serializers import dumps
+
+def _exercise(path, key, budget=None, n_cases=3):
+    # One exercise, `double`, with `n_cases` cases of `out == 2 * x` and the given time budget
+    with CaseFileWriter(str(path / 'tc_double'), key) as writer:
+        for x in range(n_cases):
+            writer.write(dumps({'x': x, 'out': 2 * x}))
+    budget = f'\n      time_budget: {budget}' if budget else ''
+    (path / 'assignment_config.yaml').write_text(f'''exercises:
+  double:
+    config:
+      case_file: tc_double{budget}
+      inputs:
+        x: {{dtype: int, check_modified: true}}
+      outputs:
+        out: {{index: 0, dtype: int, check_dtype: true, check_col_dtypes: true, check_col_order: true,
+              check_row_order: false, check_column_type: true, float_tolerance: 0}}
+''')
+
+@pytest.mark.parametrize('seconds, n_cases', [(0, 0), (60, 3)])
+def test_time_budget_with_no_minimum(tmp_path, capsys, seconds, n_cases):
+    key = Fernet.generate_key()
+    _exercise(tmp_path, key, f'{{seconds: {seconds}, min_cases: 0}}')
+    passed, _, e = execute_tests(lambda x: 2 * x, 'double', key, 10,
+                                 conf_path=str(tmp_path / 'assignment_config.yaml'), path=f'{tmp_path}/')
+    assert passed and e is None
+    assert f'ran {n_cases} iterations' in capsys.readouterr().out
+
+def _double_except_7(x):
+    return -1 if x == 7 else 2 * x
+
+@pytest.mark.parametrize('func', [lambda x: 2 * x, _double_except_7])
+def test_workers_give_the_serial_result(tmp_path, func):
+    key = Fernet.generate_key()
+    _exercise(tmp_path, key, n_cases=12)
+    results = dict()
+    for n_workers in [None, 3]:
+        trace = tmp_path / f'trace_{n_workers}.jsonl'
+        # the same shuffle of the cases for both runs
+        random.seed(0)
+        passed, (input_vars, _, returned, expected), e, stats = execute_tests(
+            func, 'double', key, 30, conf_path=str(tmp_path / 'assignment_config.yaml'), path=f'{tmp_path}/',
+            return_stats=True, trace_path=str(trace), n_workers=n_workers)
+        with open(trace) as f:
+            records = [json.loads(line) for line in f]
+        results[n_workers] = (passed, input_vars, returned, expected, type(e), str(e),
+                              [(r['iteration'], r['case'], r['passed']) for r in records], sorted(stats))
+    assert results[None] == results[3]
+    passed, input_vars, returned, *_ = results[None]
+    if func is _double_except_7:
+        assert not passed and input_vars == {'x': 7} and returned == {'out': -1}
+    else:
+        assert passed and len(results[None][6]) == 30
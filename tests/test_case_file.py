@@ -0,0 +1,90 @@
+import json
+import dill
+import pytest
+from cryptography.fernet import Fernet
+from cse6040_devkit.test_case import case_file
+from cse6040_devkit.test_case.case_file import CaseFile, CaseFileWriter, read_case_file
+from cse6040_devkit.test_case.serializers import dumps
+
+CASES = [{'x': i, 'out': [i] * i} for i in range(5)]
+
+@pytest.fixture
+def key():
+    return Fernet.generate_key()
+
+def _write(path, key, cases=CASES, serializer='dill'):
+    with CaseFileWriter(str(path), key, serializer) as writer:
+        for case in cases:
+            writer.write(dumps(case, serializer))
+    return str(path)
+
+def _index(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    trailer = data[-(case_file._TRAILER.size + len(case_file.MAGIC)):]
+    assert trailer[case_file._TRAILER.size:] == case_file.MAGIC
+    offset, length = case_file._TRAILER.unpack(trailer[:case_file._TRAILER.size])
+    return data, json.loads(data[offset:offset + length])
+
+def test_framed_layout(tmp_path, key):
+    path = _write(tmp_path / 'cases', key)
+    data, index = _index(path)
+    assert data.startswith(case_file.MAGIC + bytes([1]))
+    assert index['version'] == 1 and 'serializer' not in index
+    assert len(index['frames']) == len(CASES)
+    fernet = Fernet(key)
+    for (offset, length), case in zip(index['frames'], CASES):
+        assert dill.loads(fernet.decrypt(data[offset:offset + length])) == case
+
+def test_framed_round_trip(tmp_path, key):
+    cases = CaseFile(_write(tmp_path / 'cases', key), key)
+    assert cases.framed
+    assert len(cases) == len(CASES)
+    assert list(cases) == CASES
+    assert cases[3] == CASES[3] and cases[-1] == CASES[-1]
+    assert cases[1:4] == CASES[1:4]
+    assert read_case_file(cases.path, key) == CASES
+
+def test_framed_cases_are_fresh_copies(tmp_path, key):
+    cases = CaseFile(_write(tmp_path / 'cases', key), key)
+    cases[2]['out'].append(99)
+    assert cases[2] == CASES[2]
+
+def test_legacy_files(tmp_path, key):
+    path = tmp_path / 'legacy'
+    path.write_bytes(Fernet(key).encrypt(dill.dumps(CASES)))
+    cases = CaseFile(str(path), key)
+    assert not cases.framed
+    assert len(cases) == len(CASES)
+    assert list(cases) == CASES
+    assert cases[4] == CASES[4]
+    assert read_case_file(str(path), key) == CASES
+
+def test_load_fresh_ignores_changes_to_legacy_cases(tmp_path, key):
+    path = tmp_path / 'cases.dill'
+    path.write_bytes(Fernet(key).encrypt(dill.dumps([{'x': [1, 2]}, {'x': [3]}])))
+    cases = CaseFile(str(path), key)
+    cases[0]['x'].append(99)
+    assert cases[0]['x'] == [1, 2, 99]
+    assert cases.load_fresh(0)['x'] == [1, 2]
+
+def test_truncated_file(tmp_path, key):
+    path = _write(tmp_path / 'cases', key)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:-3])
+    with pytest.raises(ValueError, match='truncated'):
+        CaseFile(path, key)
+
+def test_newer_format_version(tmp_path, key, monkeypatch):
+    monkeypatch.setattr(case_file, 'FORMAT_VERSION', 0)
+    with pytest.raises(ValueError, match='Upgrade'):
+        CaseFile(_write(tmp_path / 'cases', key), key)
+
+def test_payload_cache_skips_decryption(tmp_path, key, monkeypatch):
+    case_file.clear_payload_cache()
+    path = _write(tmp_path / 'cases', key)
+    assert list(CaseFile(path, key)) == CASES
+    monkeypatch.setattr(Fernet, 'decrypt', lambda *args: pytest.fail('decrypted a cached frame'))
+    assert list(CaseFile(path, key)) == CASES
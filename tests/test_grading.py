@@ -0,0 +1,106 @@
+import inspect
+import os
+import pytest
+from cse6040_devkit.grading import grade_submission
+from cse6040_devkit.tester_fw import testers
+from cse6040_devkit.tester_fw.test_utils import resource_limits, CaseTimeout
+
+def _bare_tester(limits=None):
+    # A Tester with just enough state for `run_func`, without a case file
+    tester = testers.Tester.__new__(testers.Tester)
+    tester.limits = limits or dict()
+    tester.input_vars = dict()
+    tester.readonly_inputs = set()
+    tester.conf_outputs = {'out': {'index': 0}}
+    return tester
+
+def _forever():
+    while True:
+        pass
+
+def test_run_func_passes_on_enclosing_timeout():
+    with pytest.raises(CaseTimeout):
+        with resource_limits(timeout=0.2):
+            _bare_tester().run_func(_forever)
+
+def test_run_func_reports_own_timeout():
+    with pytest.raises(AssertionError, match='0.2 second limit'):
+        with resource_limits(timeout=30):
+            _bare_tester({'timeout': 0.2}).run_func(_forever)
+
+def test_submission_timeout_stops_every_exercise(tmp_path):
+    submission = tmp_path / 'sub.py'
+    submission.write_text('def f():\n    while True:\n        pass\n')
+    # The submission's namespace gets its own `_bare_tester`, so the test doesn't depend on where pytest runs from
+    setup = ['from cse6040_devkit.tester_fw import testers\n' + inspect.getsource(_bare_tester)]
+    test = '_bare_tester().run_func(f)\n'
+    rows = grade_submission(str(submission), {'ex1': test, 'ex2': test}, setup, timeout=0.5)
+    assert [row['passed'] for row in rows] == [False, False]
+    assert all('within 0.5 seconds' in row['error'] for row in rows)
+    assert sum(row['seconds'] for row in rows) < 5
+
+def _assignment(path):
+    # Smallest assignment directory `grade_submissions` can run against: one exercise testing `f() == 1`
+    import dill
+    import nbformat
+    from cryptography.fernet import Fernet
+    nb = nbformat.v4.new_notebook()
+    nb.cells.append(nbformat.v4.new_code_cell('assert f() == 1', metadata={'tags': ['ex.test']}))
+    nbformat.write(nb, str(path / 'main.ipynb'))
+    with open(path / 'keys.dill', 'wb') as f:
+        dill.dump({'visible_key': Fernet.generate_key(), 'hidden_key': Fernet.generate_key()}, f)
+    (path / 'assignment_config.yaml').write_text('exercises: {}\n')
+
+def test_dead_workers_fail_their_submission(tmp_path):
+    from cse6040_devkit.grading import grade_submissions
+    _assignment(tmp_path)
+    submissions = tmp_path / 'submissions'
+    submissions.mkdir()
+    (submissions / 'a_exit.py').write_text('import os\nos._exit(0)\n')
+    (submissions / 'b_good.py').write_text('def f():\n    return 1\n')
+    (submissions / 'c_killed.py').write_text('import os, signal\nos.kill(os.getpid(), signal.SIGKILL)\n')
+    report = grade_submissions(str(submissions), keys_path='keys.dill', conf_path='assignment_config.yaml',
+                               report_path=None, n_workers=2, assignment_path=str(tmp_path))
+    assert report['submission'].tolist() == ['a_exit.py', 'b_good.py', 'c_killed.py']
+    assert report['passed'].tolist() == [False, True, False]
+    assert 'exited with code 0' in report['error'][0]
+    assert 'exited with code -9' in report['error'][2]
+
+@pytest.mark.parametrize('strip', ['_strip_magics', '_strip_top_level_magics'])
+def test_strip_magics_keeps_continuation_lines(strip):
+    from cse6040_devkit import grading
+    for source, expected in [('x = (1\n != 2)', True), ("x = ('%d'\n % 3)", '3')]:
+        namespace = {}
+        exec(getattr(grading, strip)(source), namespace)
+        assert namespace['x'] == expected
+    assert 'matplotlib' not in grading._strip_top_level_magics('%matplotlib inline\nx = 1')
+
+def test_magics_in_submissions(tmp_path):
+    submission = tmp_path / 'sub.py'
+    submission.write_text('%matplotlib inline\n!echo hi\nfiles = !ls\n%time y = 1\n'
+                          'def f():\n    return (y\n            % 2)\n')
+    rows = grade_submission(str(submission), {'ex1': 'assert f() == 1 and files == []'})
+    assert rows[0]['passed'], rows[0]['error']
+
+def test_shared_memory_is_freed(tmp_path):
+    import dill
+    from cse6040_devkit.grading import grade_submissions
+    from cse6040_devkit.test_case import shared_store
+    from cse6040_devkit.test_case.case_file import CaseFileWriter
+    from cse6040_devkit.test_case.serializers import dumps
+    _assignment(tmp_path)
+    publicdata = tmp_path / 'resource' / 'asnlib' / 'publicdata'
+    publicdata.mkdir(parents=True)
+    (publicdata / 'assignment_config.yaml').write_text('exercises:\n  ex:\n    config: {case_file: tc_ex}\n')
+    with open(tmp_path / 'keys.dill', 'rb') as f:
+        key = dill.load(f)['visible_key']
+    with CaseFileWriter(str(publicdata / 'tc_ex'), key) as writer:
+        writer.write(dumps({'x': 1}))
+    submissions = tmp_path / 'submissions'
+    submissions.mkdir()
+    (submissions / 'good.py').write_text('def f():\n    return 1\n')
+    before = set(os.listdir('/dev/shm'))
+    report = grade_submissions(str(submissions), report_path=None, assignment_path=str(tmp_path), shared_memory=True)
+    assert report['passed'].tolist() == [True]
+    assert not shared_store._registry
+    assert set(os.listdir('/dev/shm')) <= before
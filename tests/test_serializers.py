@@ -0,0 +1,159 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from cse6040_devkit.test_case import serializers
+from cse6040_devkit.test_case.serializers import dumps, loads
+
+def _frames():
+    n = 200
+    return {
+        'plain': pd.DataFrame({'a': np.arange(n), 'b': np.linspace(0, 1, n), 'c': [f's{i}' for i in range(n)]}),
+        'duplicate_columns': pd.DataFrame(np.arange(3 * n).reshape(n, 3), columns=['a', 'a', 'b']),
+        'multiindex': pd.DataFrame(np.arange(2 * n, dtype=float).reshape(n, 2),
+                                   index=pd.MultiIndex.from_product([range(n // 2), ['x', 'y']]),
+                                   columns=pd.MultiIndex.from_tuples([('v', 1), ('v', 2)])),
+        'categorical': pd.DataFrame({'k': pd.Categorical(['lo', 'hi'] * (n // 2), categories=['lo', 'hi'], ordered=True),
+                                     'v': np.arange(n)}),
+        'tz_aware': pd.DataFrame({'t': pd.date_range('2024-01-01', periods=n, freq='h', tz='US/Eastern'),
+                                  'v': np.arange(n, dtype='int32')}),
+        'nullable': pd.DataFrame({'i': pd.array([1, None] * (n // 2), dtype='Int64'), 'b': [True, False] * (n // 2)}),
+        'empty': pd.DataFrame({'a': pd.Series([], dtype=float), 'b': pd.Series([], dtype=object)}),
+        'no_columns': pd.DataFrame(index=range(3)),
+    }
+
+FRAMES = _frames()
+
+def _nested():
+    def inner(x):
+        return x + 1
+    return inner
+
+def _assert_same(a, b):
+    if isinstance(a, pd.DataFrame):
+        pd.testing.assert_frame_equal(a, b)
+        assert a.attrs == b.attrs
+    elif isinstance(a, np.ndarray):
+        assert a.dtype == b.dtype and a.shape == b.shape
+        np.testing.assert_array_equal(a, b)
+    else:
+        assert a == b
+
+@pytest.mark.parametrize('name', sorted(FRAMES))
+@pytest.mark.parametrize('serializer', ['dill', 'pickle5', 'columnar'])
+def test_frame_round_trip(serializer, name):
+    df = FRAMES[name].copy()
+    df.attrs = {'source': name}
+    _assert_same(df, loads(dumps(df, serializer), serializer))
+
+@pytest.mark.parametrize('arr', [np.arange(1000.0).reshape(20, 50), np.asfortranarray(np.ones((30, 40))),
+                                 np.arange(100)[::3], np.array([], dtype='int8'), np.array(['a', 'bc'])])
+def test_pickle5_arrays(arr):
+    out = loads(dumps(arr, 'pickle5'), 'pickle5')
+    _assert_same(arr, out)
+    assert out.flags.writeable
+
+def test_pickle5_loads_independent_copies():
+    payload = dumps({'a': np.zeros(1000)}, 'pickle5')
+    first = loads(payload, 'pickle5')
+    first['a'][:] = 1
+    assert not loads(payload, 'pickle5')['a'].any()
+
+def test_pickle5_functions_need_dill():
+    square = lambda x: x * x  # noqa: E731
+    payload = dumps({'f': square, 'g': _nested(), 'data': np.arange(500)}, 'pickle5')
+    assert payload[:1] == serializers._PICKLE5
+    out = loads(payload, 'pickle5')
+    assert out['f'](3) == 9 and out['g'](1) == 2
+    np.testing.assert_array_equal(out['data'], np.arange(500))
+
+def test_pickle5_falls_back_to_dill():
+    # The C pickler refuses modules, which dill pickles by reference
+    payload = dumps({'module': np, 'data': np.arange(10)}, 'pickle5')
+    assert payload[:1] == serializers._DILL
+    out = loads(payload, 'pickle5')
+    assert out['module'] is np
+    np.testing.assert_array_equal(out['data'], np.arange(10))
+
+def test_unknown_serializer():
+    with pytest.raises(ValueError, match='Unknown serializer'):
+        dumps(1, 'nope')
+
+def test_register_serializer(monkeypatch):
+    monkeypatch.setattr(serializers, '_serializers', dict(serializers._serializers))
+    serializers.register_serializer('repr', lambda obj: repr(obj).encode(), lambda payload: eval(bytes(payload)))
+    assert loads(dumps([1, 'a'], 'repr'), 'repr') == [1, 'a']
+
+@pytest.mark.parametrize('serializer', ['dill', 'pickle5', 'columnar'])
+def test_write_and_read_object(serializer):
+    obj = {'df': FRAMES['plain'], 'n': 3}
+    f = io.BytesIO()
+    if serializer == 'dill':
+        import dill
+        dill.dump(obj, f)
+    else:
+        serializers.write_object(f, obj, serializer)
+    f.seek(0)
+    out = serializers.read_object(f)
+    _assert_same(obj['df'], out['df'])
+    assert out['n'] == 3
+
+def test_case_file_with_pickle5(tmp_path):
+    from cryptography.fernet import Fernet
+    from cse6040_devkit.test_case.case_file import CaseFile, CaseFileWriter
+    key = Fernet.generate_key()
+    cases = [{'df': FRAMES['tz_aware'], 'i': i} for i in range(3)]
+    with CaseFileWriter(str(tmp_path / 'cases'), key, 'pickle5') as writer:
+        for case in cases:
+            writer.write(dumps(case, 'pickle5'))
+    read = CaseFile(str(tmp_path / 'cases'), key)
+    assert read.serializer == 'pickle5'
+    for case, out in zip(cases, read):
+        _assert_same(case['df'], out['df'])
+        assert case['i'] == out['i']
+
+@pytest.mark.parametrize('arr', [np.arange(1000.0).reshape(20, 50), np.asfortranarray(np.ones((30, 40))),
+                                 np.arange(1000)[::3], np.zeros((0, 300))])
+def test_columnar_arrays(arr):
+    out = loads(dumps({'arr': arr}, 'columnar'), 'columnar')['arr']
+    _assert_same(arr, out)
+    assert out.flags.writeable
+
+def test_columnar_segments():
+    from cse6040_devkit.test_case.columnar import split_payload, MIN_SEGMENT_BYTES
+    big = FRAMES['plain']
+    small = pd.DataFrame({'a': [1, 2]})
+    assert big.memory_usage(index=False).sum() >= MIN_SEGMENT_BYTES
+    body, segments = split_payload(dumps({'big': big, 'again': big, 'small': small, 'arr': np.arange(500)}, 'columnar'))
+    # the repeated frame is one segment and the small frame stays in the body
+    assert len(segments) == 2
+    out = loads(dumps({'big': big, 'again': big}, 'columnar'), 'columnar')
+    assert out['big'] is out['again']
+
+def test_columnar_falls_back_to_dill():
+    from cse6040_devkit.test_case.columnar import split_payload
+    payload = dumps({'module': np, 'df': FRAMES['plain']}, 'columnar')
+    assert split_payload(payload)[1] == []
+    assert loads(payload, 'columnar')['module'] is np
+
+def test_case_file_deduplicates_segments(tmp_path):
+    from cryptography.fernet import Fernet
+    from cse6040_devkit.test_case.case_file import CaseFile, CaseFileWriter
+    key = Fernet.generate_key()
+    shared = FRAMES['categorical']
+    cases = [{'df': shared, 'arr': np.full(300, i), 'i': i} for i in range(4)]
+    with CaseFileWriter(str(tmp_path / 'cases'), key, 'columnar') as writer:
+        for case in cases:
+            writer.write(dumps(case, 'columnar'))
+    read = CaseFile(str(tmp_path / 'cases'), key)
+    assert read.serializer == 'columnar'
+    # one segment for the shared frame and one for each distinct array
+    assert len(read.segments) == 1 + len(cases)
+    assert len({frame[2][0] for frame in read.frames}) == 1
+    for case, out in zip(cases, read):
+        _assert_same(case['df'], out['df'])
+        _assert_same(case['arr'], out['arr'])
+        assert case['i'] == out['i']
+    first = read[0]
+    first['df'].iloc[0, 1] = -1
+    assert read[0]['df'].iloc[0, 1] == shared.iloc[0, 1]
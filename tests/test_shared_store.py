@@ -0,0 +1,110 @@
+import os
+import multiprocessing
+import numpy as np
+import pandas as pd
+import pytest
+from cryptography.fernet import Fernet
+from cse6040_devkit.test_case import shared_store
+from cse6040_devkit.test_case.case_file import CaseFile, CaseFileWriter
+from cse6040_devkit.test_case.serializers import dumps
+from cse6040_devkit.test_case.shared_store import SharedCaseStore, open_cases
+
+def _cases():
+    return [{'arr': np.arange(1000.0) * i, 'df': pd.DataFrame({'a': np.arange(500) + i, 'b': ['x', 'y'] * 250}),
+             'small': np.arange(3), 'i': i} for i in range(3)]
+
+@pytest.fixture
+def case_path(tmp_path):
+    key = Fernet.generate_key()
+    with CaseFileWriter(str(tmp_path / 'cases'), key) as writer:
+        for case in _cases():
+            writer.write(dumps(case))
+    return str(tmp_path / 'cases'), key
+
+def _shm_path(store):
+    return os.path.join('/dev/shm', store.shm.name.lstrip('/'))
+
+def _assert_cases(cases):
+    assert len(cases) == 3
+    for expected, case in zip(_cases(), cases):
+        np.testing.assert_array_equal(case['arr'], expected['arr'])
+        pd.testing.assert_frame_equal(case['df'], expected['df'])
+        np.testing.assert_array_equal(case['small'], expected['small'])
+        assert case['i'] == expected['i']
+
+def test_create_register_and_unlink(case_path):
+    path, key = case_path
+    store = SharedCaseStore.create(path, key)
+    try:
+        assert os.path.exists(_shm_path(store))
+        assert open_cases(path, key) is store
+        assert store.identity == CaseFile(path, key).identity
+        _assert_cases(store)
+        _assert_cases(store[0:3])
+        case = store[1]
+        # large arrays are read-only views of the block, so they are not copied
+        assert not case['arr'].flags.writeable
+        assert np.shares_memory(case['arr'], store[1]['arr'])
+        with pytest.raises(ValueError):
+            case['arr'][0] = 1
+    finally:
+        store.unlink()
+    assert not os.path.exists(_shm_path(store))
+    assert not shared_store._registry
+    assert isinstance(open_cases(path, key), CaseFile)
+
+def test_context_manager_unlinks(case_path):
+    with SharedCaseStore.create(*case_path, register=False) as store:
+        assert not shared_store._registry
+        _assert_cases(store)
+    assert not os.path.exists(_shm_path(store))
+
+def _read_attached(name, conn):
+    store = SharedCaseStore.attach(name)
+    conn.send([(case['i'], float(case['arr'].sum()), int(case['df']['a'].sum())) for case in store])
+    store.close()
+
+def test_attach_from_another_process(case_path):
+    with SharedCaseStore.create(*case_path, register=False) as store:
+        receiver, sender = multiprocessing.get_context('spawn').Pipe(duplex=False)
+        process = multiprocessing.get_context('spawn').Process(target=_read_attached, args=(store.shm.name, sender))
+        process.start()
+        result = receiver.recv()
+        process.join()
+        assert process.exitcode == 0
+        assert result == [(c['i'], float(c['arr'].sum()), int(c['df']['a'].sum())) for c in _cases()]
+        # the reader only closed its mapping
+        assert os.path.exists(_shm_path(store))
+
+def _read_registered(path, key, conn):
+    cases = open_cases(path, key)
+    conn.send((type(cases).__name__, [case['i'] for case in cases]))
+
+def test_forked_workers_inherit_the_registry(case_path):
+    path, key = case_path
+    with SharedCaseStore.create(path, key):
+        fork = multiprocessing.get_context('fork')
+        receiver, sender = fork.Pipe(duplex=False)
+        process = fork.Process(target=_read_registered, args=(path, key, sender))
+        process.start()
+        assert receiver.recv() == ('SharedCaseStore', [0, 1, 2])
+        process.join()
+    assert not shared_store._registry
+
+def test_share_case_files(tmp_path, case_path):
+    from cse6040_devkit.grading import share_case_files
+    path, key = case_path
+    publicdata = os.path.dirname(path) + '/'
+    os.mkdir(publicdata + 'encrypted')
+    os.link(path, publicdata + 'encrypted/cases')
+    conf = tmp_path / 'config.yaml'
+    conf.write_text('exercises:\n  ex:\n    config: {case_file: cases}\n  other:\n    config: {case_file: missing}\n')
+    stores = share_case_files({'visible_key': key, 'hidden_key': key}, str(conf), publicdata)
+    try:
+        assert len(stores) == 2
+        assert all(isinstance(open_cases(store_path, key), SharedCaseStore)
+                   for store_path in (path, publicdata + 'encrypted/cases'))
+    finally:
+        for store in stores:
+            store.unlink()
+    assert not shared_store._registry
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from cryptography.fernet import Fernet
+from cse6040_devkit.test_case.case_file import CaseFile
+from cse6040_devkit.test_case import test_case_gen
+
+class _Sums(test_case_gen.TestCaseGenerator):
+    # Inputs come from one random stream shared by all cases, so they must be sampled in order
+    def __init__(self, seed=0):
+        super().__init__()
+        self.rng = np.random.default_rng(seed)
+
+    def make_inputs(self):
+        return {'x': self.rng.integers(0, 100, size=int(self.rng.integers(1, 50)))}
+
+    def make_outputs(self):
+        return {'total': int(self.input_data['x'].sum())}
+
+class _IndependentSums(_Sums):
+    independent_cases = True
+
+    def seed_case(self, stream, case_idx):
+        self.rng = np.random.default_rng([stream, case_idx])
+
+@pytest.mark.parametrize('generator', [_Sums, _IndependentSums])
+@pytest.mark.parametrize('serializer', ['dill', 'pickle5', 'columnar'])
+def test_workers_make_the_same_payloads(generator, serializer):
+    serial = list(generator().iter_case_payloads(12, serializer=serializer))
+    parallel = list(generator().iter_case_payloads(12, n_workers=3, serializer=serializer))
+    assert serial == parallel
+
+@pytest.mark.parametrize('framed', [True, False])
+def test_write_cases_with_workers(tmp_path, framed):
+    key = Fernet.generate_key()
+    _Sums().write_cases(str(tmp_path / 'serial'), 10, key, framed=framed)
+    _Sums().write_cases(str(tmp_path / 'parallel'), 10, key, n_workers=2, framed=framed)
+    serial, parallel = CaseFile(str(tmp_path / 'serial'), key), CaseFile(str(tmp_path / 'parallel'), key)
+    assert serial.framed == parallel.framed == framed
+    assert len(serial) == len(parallel) == 10
+    for a, b in zip(serial, parallel):
+        np.testing.assert_array_equal(a['x'], b['x'])
+        assert a['total'] == b['total'] == a['x'].sum()
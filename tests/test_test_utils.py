@@ -0,0 +1,79 @@
+import pytest
+import pandas as pd
+from cse6040_devkit.tester_fw import test_utils
+
+def test_shallow_copy_unchanged_empty_frame():
+    original = pd.DataFrame({'a': pd.Series([], dtype=float), 'b': pd.Series([], dtype=int)})
+    assert test_utils.shallow_copy_unchanged(original.copy(deep=False), original)
+    assert test_utils.shallow_copy_unchanged(original['a'].copy(deep=False), original['a'])
+    assert not test_utils.shallow_copy_unchanged(original.astype({'b': float}), original)
+
+def test_compare_copies_dok_matrices():
+    from scipy import sparse
+    a = sparse.dok_matrix((3, 3))
+    a[0, 1] = 1.0
+    b = sparse.csr_matrix(a)
+    assert test_utils.compare_copies(a, b)
+    assert test_utils.compare_copies(a, sparse.dok_array(b))
+    a[2, 2] = 1.0
+    assert not test_utils.compare_copies(a, b)
+
+@pytest.mark.parametrize('query', ['SELECT a, b FROM t -- every row',
+                                   'SELECT a, b FROM t; -- every row',
+                                   'SELECT a, b FROM t /* every row */ ;;\n',
+                                   "SELECT a, b FROM t WHERE b != ';'"])
+def test_sql_result_with_trailing_comment(query):
+    import sqlite3
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (a, b)')
+    conn.executemany('INSERT INTO t VALUES (?, ?)', [(1, 'x'), (2, 'y')])
+    result = test_utils.SQLResult.from_query(conn, query)
+    assert result.columns == ['a', 'b']
+    assert '<table' in result._repr_html_()
+    expected = test_utils.SQLResult(columns=['a', 'b'], rows=[(2, 'y'), (1, 'x')])
+    assert test_utils.compare_copies(result, expected)
+    assert not test_utils.compare_copies(result, test_utils.SQLResult(columns=['a', 'b'], rows=[(1, 'x')]))
+
+def test_assert_tibble_rows_match_unhashable_cells():
+    a = pd.DataFrame({'k': [[1], [2, 3]], 'v': [0.5, 1.5]})
+    test_utils.assert_tibble_rows_match(a, a.iloc[::-1], tol=1e-6)
+    with pytest.raises(AssertionError):
+        test_utils.assert_tibble_rows_match(a, a.assign(k=[[1], [2]]), tol=1e-6)
+
+def test_resource_limits_only_tighten_memory():
+    resource = pytest.importorskip('resource')
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    strict = test_utils._address_space_size() + 2**31
+    resource.setrlimit(resource.RLIMIT_AS, (strict, hard))
+    try:
+        with test_utils.resource_limits(memory_mb=20480):
+            assert resource.getrlimit(resource.RLIMIT_AS)[0] == strict
+        with test_utils.resource_limits(memory_mb=1024):
+            assert resource.getrlimit(resource.RLIMIT_AS)[0] < strict
+        assert resource.getrlimit(resource.RLIMIT_AS)[0] == strict
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+def test_sequences_of_objects_are_not_converted(monkeypatch):
+    frames = [pd.DataFrame({'a': [i]}) for i in range(20)]
+    array = test_utils.np.array
+    def no_frame_lists(obj, *args, **kwargs):
+        if isinstance(obj, list) and obj and isinstance(obj[0], pd.DataFrame):
+            pytest.fail('converted a list of DataFrames to an array')
+        return array(obj, *args, **kwargs)
+    monkeypatch.setattr(test_utils.np, 'array', no_frame_lists)
+    assert test_utils.compare_copies(frames, [df.copy() for df in frames])
+    assert not test_utils.compare_copies(frames, frames[:-1] + [pd.DataFrame({'a': [-1]})])
+
+def test_numeric_sequences():
+    a = [[float(i), i] for i in range(20)]
+    assert test_utils.compare_copies(a, [list(row) for row in a])
+    assert test_utils.compare_copies(list(range(20)), [float(i) + 1e-12 for i in range(20)])
+    assert not test_utils.compare_copies(a, a[:-1] + [[0.0, 0]])
+    assert not test_utils.compare_copies(a, [tuple(row) for row in a])
+
+def test_frames_against_sql_results():
+    expected = test_utils.SQLResult(columns=['a', 'b'], rows=[(1, 'x'), (2, 'y')])
+    assert test_utils.compare_copies(pd.DataFrame({'a': [2, 1], 'b': ['y', 'x']}), expected)
+    assert not test_utils.compare_copies(pd.DataFrame({'a': [2, 1], 'b': ['y', 'z']}), expected)
+    assert test_utils.compare_copies(expected, pd.DataFrame({'a': [2, 1], 'b': ['y', 'x']}))
@@ -0,0 +1,43 @@
+import sqlite3
+import pandas as pd
+import pytest
+from cse6040_devkit.tester_fw import testers
+
+class _Cases(list):
+    identity = ('cases',)
+
+@pytest.fixture
+def db_tester(monkeypatch):
+    monkeypatch.setattr(testers, '_db_templates', testers.OrderedDict())
+    monkeypatch.setattr(testers, '_db_cases_seen', set())
+    monkeypatch.setattr(testers, 'MAX_DB_TEMPLATES', 2)
+    tester = testers.Tester.__new__(testers.Tester)
+    tester.cases = _Cases()
+    return tester
+
+def test_db_templates_only_for_repeated_cases(db_tester):
+    data = {'t': pd.DataFrame({'a': [1, 2]})}
+    db_tester.case_index = 0
+    first = db_tester.get_db('conn', data)
+    assert not testers._db_templates
+    first.execute('DELETE FROM t')
+    second = db_tester.get_db('conn', data)
+    assert list(testers._db_templates) == [(('cases',), 0, 'conn')]
+    assert second.execute('SELECT COUNT(*) FROM t').fetchone() == (2,)
+    assert db_tester.get_db('conn', data) is not second
+
+def test_db_templates_close_the_least_recently_used(db_tester):
+    data = {'t': pd.DataFrame({'a': [1]})}
+    for case_index in [0, 1, 0, 1, 2, 2, 0]:
+        db_tester.case_index = case_index
+        db_tester.get_db('conn', data)
+    oldest = testers._db_templates[(('cases',), 0, 'conn')]
+    assert [key[1] for key in testers._db_templates] == [2, 0]
+    db_tester.case_index = 1
+    db_tester.get_db('conn', data)
+    db_tester.get_db('conn', data)
+    assert [key[1] for key in testers._db_templates] == [0, 1]
+    db_tester.case_index = 2
+    db_tester.get_db('conn', data)
+    with pytest.raises(sqlite3.ProgrammingError):
+        oldest.execute('SELECT 1')